@@ -8,6 +8,8 @@ from pydantic import BaseModel
 import ghasedak_sms
 import config
 from traccar_client import TraccarClient
+from user_index import UserIndex
+from notification_catalog import catalog as notification_catalog
 
 router = APIRouter()
 logger = logging.getLogger("auth")
@@ -34,10 +36,11 @@ class OtpVerify(BaseModel):
 def generate_otp():
     return str(random.randint(1000, 9999))
 
-async def create_user_and_get_token(phone: str):
+async def create_user_and_get_token(phone: str, user_index: UserIndex = None):
     """
     Creates user if not exists, assigns notifications, and returns a long-lived session token.
     Mirrors the provided PHP implementation.
+    If `user_index` is given, a newly created user is added to it right away.
     """
     admin_client = TraccarClient(config.BASE_URL, config.TOKEN)
     token = None
@@ -75,6 +78,8 @@ async def create_user_and_get_token(phone: str):
                 user = await admin_client.add_user(user_payload)
                 is_new_user = True
                 logger.info(f"Created new user: {phone}")
+                if user_index is not None:
+                    user_index.add(user)
             except Exception as e:
                 logger.error(f"Failed to create user {phone}: {e}")
                 raise e
@@ -89,57 +94,13 @@ async def create_user_and_get_token(phone: str):
 
         # 3. Add Notifications (If new user)
         if is_new_user:
-            # List of notifications to add
-            # PHP creates them (as Admin) and implicitly or explicitly we should link them to User.
-            # We will Create and then Permission Link.
-            
-            # Helper to build dict structure matching PHP: id=-1, always=True
-            def make_notif(ntype, notificators, attributes):
-                return {
-                    "id": -1,
-                    "type": ntype,
-                    "always": True,
-                    "notificators": notificators,
-                    "attributes": attributes
-                }
-
-            notif_defs = [
-                make_notif("ignitionOn", "web", {}),
-                make_notif("ignitionOff", "web", {}),
-                make_notif("deviceUnknown", "web", {}),
-                make_notif("commandResult", "web", {}),
-                make_notif("deviceOnline", "web", {}),
-                make_notif("deviceOffline", "web", {}),
-                make_notif("deviceStopped", "web", {}),
-                make_notif("deviceMoving", "web", {}),
-                
-                make_notif("ignitionOn", "firebase", {}),
-                make_notif("ignitionOff", "firebase", {}),
-                
-                make_notif("alarm", "web", {"alarms": "idle"}),
-                make_notif("alarm", "web", {"alarms": "overspeed"}),
-                make_notif("alarm", "web", {"alarms": "powerCut"}),
-                make_notif("alarm", "web", {"alarms": "vibration"}),
-                make_notif("alarm", "web", {"alarms": "lowPower"}),
-                make_notif("alarm", "web", {"alarms": "tow"}),
-                
-                make_notif("alarm", "firebase", {"alarms": "idle"}),
-                make_notif("alarm", "firebase", {"alarms": "overspeed"}),
-                make_notif("alarm", "firebase", {"alarms": "powerCut"}),
-                make_notif("alarm", "firebase", {"alarms": "vibration"}),
-                make_notif("alarm", "firebase", {"alarms": "lowPower"}),
-                make_notif("alarm", "firebase", {"alarms": "tow"}),
-            ]
-            
-            for nd in notif_defs:
-                try:
-                    # Create notification
-                    notif = await admin_client.create_notification(nd)
-                    # Link to user
-                    if 'id' in notif:
-                        await admin_client.add_permission_generic("permissions", "userId", user['id'], "notificationId", notif['id'])
-                except Exception as e:
-                    logger.warning(f"Failed to add notification {nd['type']}: {e}")
+            # The standard notifications are shared: they are created once
+            # (see notification_catalog) and only linked to each new user.
+            try:
+                linked = await notification_catalog.link_user(admin_client, user['id'])
+                logger.info(f"Linked {linked} notifications to user {phone}")
+            except Exception as e:
+                logger.warning(f"Failed to add notifications for {phone}: {e}")
 
     finally:
         await admin_client.close()
@@ -220,7 +181,7 @@ async def request_otp(data: OtpRequest):
     }
 
 @router.post("/api/otpverify")
-async def verify_otp(data: OtpVerify):
+async def verify_otp(data: OtpVerify, request: Request):
     if not data.client_secret or not data.phone or not data.sms_message:
         return {"success": False, "message": "The client_secret, phone, and sms_message parameters are required"}
 
@@ -247,7 +208,8 @@ async def verify_otp(data: OtpVerify):
     
     # Use real token generation
     try:
-        token = await create_user_and_get_token(data.phone)
+        client = getattr(request.app.state, "client", None)
+        token = await create_user_and_get_token(data.phone, user_index=client.users if client else None)
     except Exception as e:
         logger.error(f"Token generation error: {e}")
         return {"success": False, "message": f"Login failed: {e}"}
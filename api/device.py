@@ -134,7 +134,9 @@ async def handle_device_request(request: Request):
     cmd_data_str = json.dumps(cmd_data)
     
     try:
-        resp = await client.send_command(device['id'], cmd_data_str)
+        # Interactive request: send right away instead of queueing behind
+        # commands already waiting for this device
+        resp = await client.send_command(device['id'], cmd_data_str, paced=False)
         # Verify success? TraccarClient implementation returns JSON. 
         # If it didn't raise exception, it's likely 200/202.
         
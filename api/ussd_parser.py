@@ -139,6 +139,13 @@ async def handle_qussd(request: Request):
         if decoded_msg:
             print(f"   ✅ [USSD MSG]: {decoded_msg}")
 
+            # USSD replies answer the qssd command sent to the device
+            tracker = getattr(client, "tracker", None)
+            if tracker:
+                dev_obj = client.registry.get_by_unique_id(imei)
+                if dev_obj:
+                    tracker.answered(dev_obj["id"], "qssd")
+
             simcard_no = extract_simcard_no(decoded_msg)
             if simcard_no:
                 print(f"   📱 [SIMCARD NO]: {simcard_no}")
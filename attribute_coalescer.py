@@ -0,0 +1,66 @@
+# attribute_coalescer.py
+import asyncio
+
+
+class AttributeCoalescer:
+    """Merge attribute updates for the same device into one write.
+
+    The first `update()` for a device opens a `window`-second buffer; every
+    update for that device arriving inside the window is merged into it (later
+    values win). When the window closes, `write(device_id, merged_attrs)` runs
+    once and every caller's future resolves with its result (or exception).
+    Flushes for the same device never overlap.
+    """
+
+    def __init__(self, write, window: float = 0.05):
+        self._write = write
+        self.window = window
+        self._pending: dict = {}   # device_id -> (merged attrs, [futures])
+        self._locks: dict = {}     # device_id -> asyncio.Lock
+        self._tasks: set = set()
+        self.requests = 0
+        self.writes = 0
+
+    async def update(self, device_id: int, attrs: dict):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.requests += 1
+
+        entry = self._pending.get(device_id)
+        if entry is None:
+            entry = self._pending[device_id] = ({}, [])
+            loop.call_later(self.window, self._schedule_flush, device_id)
+        entry[0].update(attrs)
+        entry[1].append(fut)
+        return await fut
+
+    def busy(self, device_id: int) -> bool:
+        """True while an update for the device is buffered or being written."""
+        return device_id in self._pending or device_id in self._locks
+
+    def _schedule_flush(self, device_id: int):
+        task = asyncio.ensure_future(self._flush(device_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, device_id: int):
+        lock = self._locks.setdefault(device_id, asyncio.Lock())
+        async with lock:
+            attrs, futures = self._pending.pop(device_id)
+            self.writes += 1
+            try:
+                result = await self._write(device_id, attrs)
+            except Exception as e:
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_result(result)
+        if not lock.locked() and device_id not in self._pending:
+            self._locks.pop(device_id, None)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "writes": self.writes,
+                "pending": len(self._pending)}
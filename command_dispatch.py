@@ -0,0 +1,91 @@
+# command_dispatch.py
+import re
+import time
+from typing import Optional
+from metrics import LatencyHistogram
+
+
+class _Route:
+    def __init__(self, name: str, prefix: str, handler):
+        self.name = name
+        self.prefix = prefix
+        self.handler = handler
+        self.count = 0
+        self.parse_failures = 0
+        self.failures = 0
+        self.latency = LatencyHistogram()
+
+
+class CommandDispatcher:
+    """Routes command results (`event.attributes.result`) to handlers by prefix.
+
+    `register(prefix, handler)` adds a response format; `handler(device_id,
+    result)` parses the result and returns the coroutine that does the work
+    (or None when there is nothing to do). All prefixes are compiled into one
+    anchored regex, so matching is a single pass over the start of the result
+    no matter how many formats are registered; the longest prefix wins.
+
+    Per handler it records how many results matched, how many failed to
+    parse, how many failed while running, and a latency histogram.
+    `on_match(device_id, name)` is called for every matched result.
+    """
+
+    def __init__(self, on_match=None):
+        self._routes: dict = {}
+        self._pattern = None
+        self._on_match = on_match
+        self.unmatched = 0
+
+    def register(self, prefix: str, handler, name: str = None):
+        self._routes[prefix] = _Route(name or prefix.rstrip(":").strip(), prefix, handler)
+        prefixes = sorted(self._routes, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(p) for p in prefixes))
+
+    def match(self, result: str) -> Optional[_Route]:
+        if not self._pattern:
+            return None
+        m = self._pattern.match(result)
+        return self._routes[m.group(0)] if m else None
+
+    def route(self, device_id: int, result: str):
+        """Parse `result` with its handler; returns a timed coroutine or None."""
+        route = self.match(result)
+        if route is None:
+            self.unmatched += 1
+            return None
+
+        route.count += 1
+        if self._on_match:
+            self._on_match(device_id, route.name)
+        try:
+            coro = route.handler(device_id, result)
+        except Exception as e:
+            route.parse_failures += 1
+            print(f"❌ {route.name} parse error: {e} | raw: {result}")
+            return None
+        if coro is None:
+            return None
+        return self._timed(route, coro)
+
+    async def _timed(self, route: _Route, coro):
+        started = time.monotonic()
+        try:
+            await coro
+        except Exception:
+            route.failures += 1
+            raise
+        finally:
+            route.latency.observe(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        out = {
+            route.name: {
+                "count": route.count,
+                "parse_failures": route.parse_failures,
+                "failures": route.failures,
+                "latency": route.latency.snapshot(),
+            }
+            for route in self._routes.values()
+        }
+        out["unmatched"] = self.unmatched
+        return out
@@ -0,0 +1,146 @@
+# command_queue.py
+import asyncio
+import time
+from collections import deque
+
+
+class _DeviceLane:
+    __slots__ = ("items", "task", "last_sent", "awaiting", "awaiting_since", "awaiting_result", "answered")
+
+    def __init__(self):
+        self.items = deque()          # (command, kwargs, future)
+        self.task = None
+        self.last_sent = None
+        self.awaiting = None          # command sent and not yet answered
+        self.awaiting_since = 0.0
+        self.awaiting_result = None
+        self.answered = asyncio.Event()
+
+
+class DeviceCommandQueue:
+    """Per-device outbound command queue with dedup and pacing.
+
+    Commands for one device go out one at a time: at least `min_gap` seconds
+    apart, and, when the previous command expects a reply
+    (`expects_answer(command)`), not before that reply arrives (`settled()`)
+    or `release_timeout` seconds pass. Different devices don't wait for each
+    other. A command identical to one already queued for the device shares
+    its send, and one identical to the command still awaiting its reply is
+    dropped (the earlier send's result is returned). A `retry` (resend of
+    an unanswered command) skips that check and goes to the front of the
+    device's queue.
+    """
+
+    def __init__(self, send, min_gap: float = 5.0, release_timeout: float = 60.0, expects_answer=None):
+        self._send = send
+        self._expects_answer = expects_answer
+        self.min_gap = min_gap
+        self.release_timeout = release_timeout
+        self._lanes: dict = {}
+        self.sent = 0
+        self.deduplicated = 0
+        self.gap_waits = 0
+        self.answer_waits = 0
+        self.released_by_timeout = 0
+
+    async def submit(self, device_id: int, command: str, retry: bool = False, **kwargs):
+        """Queue `command` for the device; returns the send result once it has gone out."""
+        lane = self._lanes.get(device_id)
+        if lane is None:
+            lane = self._lanes[device_id] = _DeviceLane()
+
+        if retry:
+            fut = asyncio.get_running_loop().create_future()
+            lane.items.appendleft((command, kwargs, fut))
+            if lane.task is None:
+                lane.task = asyncio.create_task(self._drain(device_id, lane))
+            return await asyncio.shield(fut)
+
+        for queued, _, fut in lane.items:
+            if queued == command:
+                self.deduplicated += 1
+                return await asyncio.shield(fut)
+        if (lane.awaiting == command and not lane.answered.is_set()
+                and time.monotonic() - lane.awaiting_since < self.release_timeout):
+            self.deduplicated += 1
+            return lane.awaiting_result
+
+        fut = asyncio.get_running_loop().create_future()
+        lane.items.append((command, kwargs, fut))
+        if lane.task is None:
+            lane.task = asyncio.create_task(self._drain(device_id, lane))
+        return await asyncio.shield(fut)
+
+    def settled(self, device_id: int, *_):
+        """The device answered (or gave up on) its outstanding command."""
+        lane = self._lanes.get(device_id)
+        if lane is None:
+            return
+        lane.answered.set()
+        if lane.task is None and not lane.items:
+            del self._lanes[device_id]
+
+    async def _drain(self, device_id: int, lane: _DeviceLane):
+        try:
+            while lane.items:
+                if lane.awaiting is not None and not lane.answered.is_set():
+                    remaining = lane.awaiting_since + self.release_timeout - time.monotonic()
+                    if remaining > 0:
+                        self.answer_waits += 1
+                        try:
+                            await asyncio.wait_for(lane.answered.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            self.released_by_timeout += 1
+                    else:
+                        self.released_by_timeout += 1
+
+                if lane.last_sent is not None:
+                    gap = lane.last_sent + self.min_gap - time.monotonic()
+                    if gap > 0:
+                        self.gap_waits += 1
+                        await asyncio.sleep(gap)
+
+                # Popped only now: a retry may have been put in front meanwhile
+                command, kwargs, fut = lane.items.popleft()
+                try:
+                    result = await self._send(device_id, command, **kwargs)
+                except Exception as e:
+                    if not fut.done():
+                        fut.set_exception(e)
+                    fut.exception()   # retrieved here if no caller is left to
+                    continue
+                lane.last_sent = time.monotonic()
+                self.sent += 1
+                if self._expects_answer and self._expects_answer(command):
+                    lane.awaiting = command
+                    lane.awaiting_since = lane.last_sent
+                    lane.awaiting_result = result
+                    lane.answered.clear()
+                else:
+                    lane.awaiting = None
+                if not fut.done():
+                    fut.set_result(result)
+        finally:
+            lane.task = None
+            for _, _, fut in lane.items:
+                fut.cancel()
+            lane.items.clear()
+            if lane.awaiting is None or lane.answered.is_set():
+                self._lanes.pop(device_id, None)
+
+    async def stop(self):
+        tasks = [lane.task for lane in self._lanes.values() if lane.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self._lanes),
+            "queued": sum(len(lane.items) for lane in self._lanes.values()),
+            "sent": self.sent,
+            "deduplicated": self.deduplicated,
+            "gap_waits": self.gap_waits,
+            "answer_waits": self.answer_waits,
+            "released_by_timeout": self.released_by_timeout,
+        }
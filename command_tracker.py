@@ -0,0 +1,188 @@
+# command_tracker.py
+import asyncio
+import json
+import time
+from typing import Optional
+from metrics import LatencyHistogram
+
+# Dispatcher route name (see DeviceService._register_result_handlers) or
+# other response source -> the command type it answers
+RESPONSE_COMMANDS = {
+    "ALLPARAMS": "ALLPARAMS",
+    "Param ID": "getparam",
+    "VERSION": "getver",
+    "IMSI": "getimsi",
+    "PASS": "getpass",
+    "cmd 29": "cmd 29",
+    "qssd": "qssd",      # USSD replies posted to /qussd.php
+}
+_ANSWERED_TYPES = frozenset(RESPONSE_COMMANDS.values())
+
+
+def is_retryable(ctype: str) -> bool:
+    """Only read-only queries are resent; `cmd 29` and setters are not safe to repeat."""
+    return ctype.startswith("get") or ctype in ("qssd", "ALLPARAMS")
+
+
+def command_type(data: str) -> str:
+    """Short type of a custom command: "qssd:*140#" -> "qssd", "bacmd:ALLPARAMS" -> "ALLPARAMS"."""
+    data = (data or "").strip()
+    if data.startswith("{"):
+        try:
+            return f"cmd {json.loads(data).get('c')}"
+        except (ValueError, AttributeError):
+            return "json"
+    if data.startswith("bacmd:"):
+        data = data[len("bacmd:"):]
+    return data.replace(":", " ").split(" ", 1)[0]
+
+
+class _Pending:
+    __slots__ = ("device_id", "type", "command", "model", "sent_at", "deadline", "attempts")
+
+    def __init__(self, device_id, ctype, command, model, sent_at, deadline):
+        self.device_id = device_id
+        self.type = ctype
+        self.command = command
+        self.model = model
+        self.sent_at = sent_at
+        self.deadline = deadline
+        self.attempts = 1
+
+
+class CommandTracker:
+    """Match outgoing commands to the results that answer them.
+
+    `sent()` records a command per (device, command type); `answered()` is
+    called when a result of that type arrives and records the round trip.
+    A command not answered within `timeout` seconds is resent (via
+    `resend(device_id, command)`) up to `max_retries` times, each wait
+    `backoff` times longer than the last, as long as `is_online(device_id)`
+    says the device is still connected and the command is a read-only query
+    (`is_retryable`). After that it is counted as a timeout against the
+    device.
+
+    Latency histograms are kept per command type and per device model;
+    `stats()` also lists the devices with the most unanswered commands in a
+    row. `on_settled(device_id, type)` is called once a command is answered
+    or given up on.
+    """
+
+    def __init__(self, resend=None, timeout: float = 180.0, max_retries: int = 1,
+                 backoff: float = 2.0, is_online=None, check_interval: float = 5.0,
+                 on_settled=None):
+        self._resend = resend
+        self._is_online = is_online
+        self.on_settled = on_settled
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.check_interval = check_interval
+        self._pending: dict = {}   # (device_id, type) -> _Pending
+        self._by_type: dict = {}   # type -> counters + latency
+        self._by_model: dict = {}  # model -> LatencyHistogram
+        self._silent: dict = {}    # device_id -> unanswered commands in a row
+        self._tasks: set = set()
+        self._task = None
+        self.unmatched = 0
+
+    def _type_stats(self, ctype: str) -> dict:
+        st = self._by_type.get(ctype)
+        if st is None:
+            st = self._by_type[ctype] = {"sent": 0, "answered": 0, "retries": 0,
+                                         "timeouts": 0, "latency": LatencyHistogram()}
+        return st
+
+    @staticmethod
+    def expects_answer(command: str) -> bool:
+        """True if results of this command type are recognised (and so can be waited for)."""
+        return command_type(command) in _ANSWERED_TYPES
+
+    def sent(self, device_id: int, command: str, model: str = None, now: float = None):
+        now = time.monotonic() if now is None else now
+        ctype = command_type(command)
+        self._pending[(device_id, ctype)] = _Pending(device_id, ctype, command, model, now, now + self.timeout)
+        self._type_stats(ctype)["sent"] += 1
+
+    def answered(self, device_id: int, response: str, now: float = None) -> Optional[float]:
+        """Record a result named `response`; returns the round trip in seconds, if matched."""
+        ctype = RESPONSE_COMMANDS.get(response)
+        entry = self._pending.pop((device_id, ctype), None) if ctype else None
+        if entry is None:
+            self.unmatched += 1
+            return None
+        now = time.monotonic() if now is None else now
+        latency = now - entry.sent_at
+        st = self._type_stats(ctype)
+        st["answered"] += 1
+        st["latency"].observe(latency)
+        if entry.model:
+            self._by_model.setdefault(entry.model, LatencyHistogram()).observe(latency)
+        self._silent.pop(device_id, None)
+        if self.on_settled:
+            self.on_settled(device_id, ctype)
+        return latency
+
+    def expire(self, now: float = None):
+        """Retry or give up on every command past its deadline."""
+        now = time.monotonic() if now is None else now
+        for key, entry in list(self._pending.items()):
+            if entry.deadline > now:
+                continue
+            st = self._type_stats(entry.type)
+            online = self._is_online(entry.device_id) if self._is_online else True
+            if (self._resend and online and entry.attempts <= self.max_retries
+                    and is_retryable(entry.type)):
+                entry.deadline = now + self.timeout * self.backoff ** entry.attempts
+                entry.attempts += 1
+                entry.sent_at = now
+                st["retries"] += 1
+                task = asyncio.ensure_future(self._retry(entry))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                continue
+            del self._pending[key]
+            st["timeouts"] += 1
+            self._silent[entry.device_id] = self._silent.get(entry.device_id, 0) + 1
+            if self.on_settled:
+                self.on_settled(entry.device_id, entry.type)
+
+    async def _retry(self, entry: _Pending):
+        try:
+            await self._resend(entry.device_id, entry.command)
+            print(f"🔁 Resent {entry.type} to device {entry.device_id} (attempt {entry.attempts})")
+        except Exception as e:
+            print(f"❌ Failed to resend {entry.type} to device {entry.device_id}: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            self.expire()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._tasks) + ([self._task] if self._task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def silent_devices(self, limit: int = 10) -> list:
+        """`(device_id, unanswered in a row)` for the least responsive devices."""
+        return sorted(self._silent.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "unmatched": self.unmatched,
+            "by_type": {
+                ctype: {**{k: v for k, v in st.items() if k != "latency"},
+                        "latency": st["latency"].snapshot()}
+                for ctype, st in self._by_type.items()
+            },
+            "by_model": {model: h.snapshot() for model, h in self._by_model.items()},
+            "silent_devices": self.silent_devices(),
+        }
@@ -8,6 +8,65 @@ GHASEDAK_OTP_API_KEY = "c08a67abd3ce23c7843d0bdac2e320b01f00e1b1ae2ab796f4a01982
 APP_HASH_KEY = "myapphashkeyhere"
 CLIENT_SECRET = "dfgdfgdfg"
 
+# Bulk command sends (sweeps, catch-ups), shared by all of them: max POSTs in
+# flight, and commands started per second
+COMMAND_CONCURRENCY = 10
+COMMAND_RATE = 20
+# Periodic sweeps spread their commands evenly (with per-device jitter) over
+# this many seconds instead of sending them in one burst; 0 sends at once
+COMMAND_SWEEP_WINDOW = 30 * 60
+
+# Command/response tracking: seconds to wait for a result, resends of an
+# unanswered command to a device still online, and the wait multiplier per resend
+COMMAND_RESPONSE_TIMEOUT = 180
+COMMAND_MAX_RETRIES = 1
+COMMAND_RETRY_BACKOFF = 2.0
+
+# Commands to one device are queued: at least this many seconds apart, and
+# held until the previous one is answered or the release timeout passes (the
+# same as the response timeout, so a resend goes out before the next command)
+COMMAND_DEVICE_GAP = 5
+COMMAND_RELEASE_TIMEOUT = COMMAND_RESPONSE_TIMEOUT
+
+# Attribute updates to the same device within this many seconds share one PUT
+ATTRIBUTE_COALESCE_WINDOW = 0.05
+
+# Attribute PUTs are built from the cached device while it is younger than this
+# (seconds); older copies are re-read from Traccar first
+DEVICE_CACHE_MAX_AGE = 600
+
+# Seconds between full reloads of the device list (also done on WS reconnect),
+# so devices deleted in Traccar drop out of the registry
+DEVICE_RESYNC_INTERVAL = 6 * 3600
+
+# Full rebuild interval (seconds) for the username -> user id index
+USER_INDEX_TTL = 3600
+
+# WebSocket frames are queued (bounded) and handled by a fixed worker pool.
+# One worker keeps frames in arrival order, so per-device event order holds;
+# the handlers themselves run in parallel in the event lanes below.
+WS_WORKERS = 1
+WS_QUEUE_SIZE = 1000
+
+# Event handlers run in per-device lanes (ordered per device); how many devices
+# may run at once, and how many handlers may wait before the WS workers block
+EVENT_LANE_PARALLELISM = 16
+EVENT_LANE_MAX_PENDING = 5000
+
+# After a WS reconnect, missed commandResult events are re-read from the events
+# report: devices per request, and the longest gap (seconds) to look back
+BACKFILL_BATCH_SIZE = 50
+BACKFILL_MAX_GAP = 6 * 3600
+
+# Event-id dedup window (seconds) and size cap; the window is saved to the DB
+# on shutdown and reloaded on startup when persistence is on
+EVENT_DEDUP_TTL = 6 * 3600
+EVENT_DEDUP_MAX_ENTRIES = 200000
+EVENT_DEDUP_PERSIST = True
+
+# Seconds a newly seen device is left to settle before provisioning sends getver
+PROVISION_GETVER_DELAY = 120
+
 # SSL Certificates
 #SSL_FULLCHAIN_PEM = "/etc/letsencrypt/live/register.niktivan.ir/fullchain.pem"
 #SSL_PRIVKEY_PEM   = "/etc/letsencrypt/live/register.niktivan.ir/privkey.pem"
\ No newline at end of file
@@ -21,7 +21,7 @@ def get_connection():
 def init_db():
     """
     Initialize the database schema.
-    Creates the 'firmwares' table if it doesn't exist.
+    Creates the tables if they don't exist.
     """
     schema = """
     CREATE TABLE IF NOT EXISTS firmwares (
@@ -44,6 +44,41 @@ def init_db():
         date TEXT,
         attr TEXT
     );
+
+    CREATE TABLE IF NOT EXISTS seen_events (
+        event_id INTEGER PRIMARY KEY,
+        seen_at REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS device_params (
+        device_id INTEGER,
+        kind TEXT,
+        param_id INTEGER,
+        value TEXT,
+        changed_at REAL,
+        PRIMARY KEY (device_id, kind, param_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job TEXT PRIMARY KEY,
+        last_run REAL,
+        sweep_started REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS job_device_sent (
+        job TEXT,
+        device_id INTEGER,
+        sent_at REAL,
+        PRIMARY KEY (job, device_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_job_device_sent_device ON job_device_sent (device_id);
+
+    CREATE TABLE IF NOT EXISTS provision_jobs (
+        device_id INTEGER,
+        step TEXT,
+        due_at REAL,
+        PRIMARY KEY (device_id, step)
+    );
     """
     try:
         with get_connection() as conn:
@@ -89,3 +124,146 @@ def log_fota_request(imei, serial, firmware, device, rev, result, date, attr="")
             conn.commit()
     except Exception as e:
         print(f"❌ Failed to log FOTA request: {e}")
+
+
+def load_seen_events():
+    """Return the persisted event-dedup window as (event_id, seen_at) pairs."""
+    try:
+        with get_connection() as conn:
+            return conn.execute("SELECT event_id, seen_at FROM seen_events").fetchall()
+    except Exception as e:
+        print(f"❌ Failed to load seen events: {e}")
+        return []
+
+def save_seen_events(entries):
+    """Replace the persisted event-dedup window with `entries` ((event_id, seen_at) pairs)."""
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM seen_events")
+            conn.executemany("INSERT OR REPLACE INTO seen_events (event_id, seen_at) VALUES (?, ?)", entries)
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to save seen events: {e}")
+
+
+def load_device_params(device_id: int, kind: str):
+    """Return the stored (param_id, value) pairs of one device's parameter set."""
+    try:
+        with get_connection() as conn:
+            return conn.execute(
+                "SELECT param_id, value FROM device_params WHERE device_id = ? AND kind = ?",
+                (device_id, kind),
+            ).fetchall()
+    except Exception as e:
+        print(f"❌ Failed to load params for device {device_id}: {e}")
+        return []
+
+def save_device_params(device_id: int, kind: str, params, changed_at: float):
+    """Upsert (param_id, value) pairs, stamping them with `changed_at`."""
+    try:
+        with get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO device_params (device_id, kind, param_id, value, changed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(device_id, kind, k, v, changed_at) for k, v in params],
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to save params for device {device_id}: {e}")
+
+def delete_device_params(device_id: int, kind: str, param_ids):
+    try:
+        with get_connection() as conn:
+            conn.executemany(
+                "DELETE FROM device_params WHERE device_id = ? AND kind = ? AND param_id = ?",
+                [(device_id, kind, k) for k in param_ids],
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to delete params for device {device_id}: {e}")
+
+
+def load_provision_jobs():
+    """Return pending provisioning steps as (device_id, step, due_at) rows."""
+    try:
+        with get_connection() as conn:
+            return conn.execute("SELECT device_id, step, due_at FROM provision_jobs").fetchall()
+    except Exception as e:
+        print(f"❌ Failed to load provisioning jobs: {e}")
+        return []
+
+def save_provision_job(device_id: int, step: str, due_at: float):
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO provision_jobs (device_id, step, due_at) VALUES (?, ?, ?)",
+                (device_id, step, due_at),
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to save provisioning job for device {device_id}: {e}")
+
+def delete_provision_job(device_id: int, step: str):
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM provision_jobs WHERE device_id = ? AND step = ?", (device_id, step))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to delete provisioning job for device {device_id}: {e}")
+
+
+def load_job_state(job: str):
+    """Return `(last_run, sweep_started)` of a periodic job, or (None, None)."""
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT last_run, sweep_started FROM job_runs WHERE job = ?", (job,)).fetchone()
+            return tuple(row) if row else (None, None)
+    except Exception as e:
+        print(f"❌ Failed to load state of job {job}: {e}")
+        return (None, None)
+
+def save_job_state(job: str, last_run, sweep_started):
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_runs (job, last_run, sweep_started) VALUES (?, ?, ?)",
+                (job, last_run, sweep_started),
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to save state of job {job}: {e}")
+
+def load_job_sent(job: str, since: float) -> set:
+    """Device ids the job sent to at or after `since`."""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                "SELECT device_id FROM job_device_sent WHERE job = ? AND sent_at >= ?", (job, since)
+            ).fetchall()
+            return {r[0] for r in rows}
+    except Exception as e:
+        print(f"❌ Failed to load sent devices of job {job}: {e}")
+        return set()
+
+def mark_job_sent(job: str, device_id: int, sent_at: float):
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_device_sent (job, device_id, sent_at) VALUES (?, ?, ?)",
+                (job, device_id, sent_at),
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Failed to record {job} send to device {device_id}: {e}")
+
+def load_device_last_sent(device_id: int) -> dict:
+    """job name -> when that periodic job last sent to the device."""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                "SELECT job, sent_at FROM job_device_sent WHERE device_id = ?", (device_id,)
+            ).fetchall()
+            return dict(rows)
+    except Exception as e:
+        print(f"❌ Failed to load job history of device {device_id}: {e}")
+        return {}
@@ -0,0 +1,151 @@
+# device_registry.py
+import time
+from typing import Optional
+
+
+def project_device(dev: dict, fields=None, attributes=None) -> dict:
+    """Keep only `fields` of a device, and only `attributes` of its attributes.
+
+    None keeps everything for that level. `id` is always kept.
+    """
+    if fields is None and attributes is None:
+        return dev
+    out = dev if fields is None else {k: dev[k] for k in fields if k in dev}
+    out["id"] = dev.get("id")
+    if attributes is not None:
+        attrs = dev.get("attributes") or {}
+        out = dict(out)
+        out["attributes"] = {k: attrs[k] for k in attributes if k in attrs}
+    return out
+
+
+class DeviceRegistry:
+    """In-process copy of the Traccar device list.
+
+    Loaded once at startup and kept current from the WebSocket `devices`
+    frames, so lookups by id / uniqueId / model / status don't need a REST
+    round trip. Returned devices are copies: callers are free to mutate them
+    (and their `attributes`) without touching the registry.
+
+    Every device carries a version, bumped on each `put`, and the time it was
+    last synced from Traccar. Writers use these to build PUTs from the cached
+    copy and to notice when it changed (or went stale) underneath them.
+    """
+
+    def __init__(self):
+        self._by_id: dict = {}
+        self._by_unique_id: dict = {}
+        self._versions: dict = {}
+        self._synced_at: dict = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, device_id):
+        return device_id in self._by_id
+
+    @staticmethod
+    def _copy(dev: dict) -> dict:
+        out = dict(dev)
+        out["attributes"] = dict(dev.get("attributes") or {})
+        return out
+
+    # -----------------------------------------------------------
+    # Writes
+    # -----------------------------------------------------------
+    def load(self, devices):
+        """Replace the registry contents with `devices` (any iterable)."""
+        self._by_id = {}
+        self._by_unique_id = {}
+        self._synced_at = {}
+        for dev in devices:
+            self.put(dev)
+        self.loaded = True
+
+    def put(self, dev: dict):
+        """Insert or merge a device object (REST response, WS frame or PUT payload)."""
+        dev_id = dev.get("id")
+        if not dev_id:
+            return
+        current = self._by_id.get(dev_id)
+        if current is None:
+            current = self._copy(dev)
+        else:
+            old_unique_id = current.get("uniqueId")
+            current.update(dev)
+            if "attributes" in dev:
+                current["attributes"] = dict(dev.get("attributes") or {})
+            if old_unique_id != current.get("uniqueId"):
+                self._by_unique_id.pop(old_unique_id, None)
+        self._by_id[dev_id] = current
+        self._versions[dev_id] = self._versions.get(dev_id, 0) + 1
+        self._synced_at[dev_id] = time.monotonic()
+        unique_id = current.get("uniqueId")
+        if unique_id:
+            self._by_unique_id[unique_id] = dev_id
+
+    def retain(self, device_ids: set):
+        """Drop every device not in `device_ids`, after `put`-ing a full listing."""
+        for device_id in set(self._by_id) - set(device_ids):
+            self.remove(device_id)
+        self.loaded = True
+
+    def remove(self, device_id: int):
+        dev = self._by_id.pop(device_id, None)
+        self._synced_at.pop(device_id, None)
+        if dev:
+            self._by_unique_id.pop(dev.get("uniqueId"), None)
+
+    def mark_stale(self, device_id: int):
+        """Force the next write for this device to re-read it from Traccar."""
+        self._synced_at.pop(device_id, None)
+
+    def version(self, device_id: int) -> int:
+        return self._versions.get(device_id, 0)
+
+    def age(self, device_id: int) -> Optional[float]:
+        """Seconds since the device was last synced, or None if unknown/stale."""
+        synced_at = self._synced_at.get(device_id)
+        return time.monotonic() - synced_at if synced_at is not None else None
+
+    # -----------------------------------------------------------
+    # Reads
+    # -----------------------------------------------------------
+    def get(self, device_id: int) -> Optional[dict]:
+        dev = self._by_id.get(device_id)
+        return self._copy(dev) if dev else None
+
+    def model(self, device_id: int) -> Optional[str]:
+        """Model (top-level, else `attributes.model`) without copying the device."""
+        dev = self._by_id.get(device_id)
+        if not dev:
+            return None
+        return dev.get("model") or (dev.get("attributes") or {}).get("model")
+
+    def status(self, device_id: int) -> Optional[str]:
+        dev = self._by_id.get(device_id)
+        return dev.get("status") if dev else None
+
+    def get_by_unique_id(self, unique_id: str) -> Optional[dict]:
+        dev_id = self._by_unique_id.get(unique_id)
+        return self.get(dev_id) if dev_id else None
+
+    def ids(self) -> set:
+        return set(self._by_id)
+
+    def all(self) -> list:
+        return [self._copy(d) for d in self._by_id.values()]
+
+    def filter(self, model: str = None, status: str = None) -> list:
+        """Devices matching `model` (top-level or `attributes.model`) and/or `status`."""
+        out = []
+        for dev in self._by_id.values():
+            if model is not None and not (
+                dev.get("model") == model or dev.get("attributes", {}).get("model") == model
+            ):
+                continue
+            if status is not None and dev.get("status") != status:
+                continue
+            out.append(self._copy(dev))
+        return out
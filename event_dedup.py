@@ -0,0 +1,72 @@
+# event_dedup.py
+import time
+from collections import OrderedDict
+
+
+class EventDeduplicator:
+    """Set of recently seen event ids with time-based expiry and a size cap.
+
+    Lookups are O(1) hash hits. Ids are kept in insertion order, so expiring
+    the ones older than `ttl` seconds, or evicting the oldest once
+    `max_entries` is reached, only ever touches the front of the table. Times
+    are wall-clock so the window can be saved and reloaded across restarts.
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, max_entries: int = 200000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen: OrderedDict = OrderedDict()   # event_id -> seen_at
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl
+        while self._seen:
+            event_id, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff:
+                break
+            self._seen.popitem(last=False)
+            self.expired += 1
+
+    def seen(self, event_id, now: float = None) -> bool:
+        """True if `event_id` was already seen in the window; otherwise record it."""
+        now = time.time() if now is None else now
+        self._expire(now)
+        if event_id in self._seen:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._seen[event_id] = now
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+            self.evicted += 1
+        return False
+
+    def entries(self) -> list:
+        """`(event_id, seen_at)` pairs, oldest first; for persisting the window."""
+        self._expire(time.time())
+        return list(self._seen.items())
+
+    def load(self, entries):
+        """Restore `(event_id, seen_at)` pairs saved by `entries()`."""
+        for event_id, seen_at in sorted(entries, key=lambda e: e[1]):
+            self._seen[event_id] = seen_at
+        self._expire(time.time())
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,119 @@
+# json_codec.py
+"""JSON encode/decode used for Traccar traffic.
+
+Uses orjson when it is installed (several times faster on large device
+lists and WS frames) and falls back to the stdlib `json` module otherwise.
+Both paths work on bytes: `loads` accepts bytes or str, `dumps` returns
+UTF-8 bytes ready to send as a request body.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _std_loads(data):
+    return json.loads(data)
+
+
+def _std_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+    NAME = "orjson"
+    loads = orjson.loads
+    dumps = orjson.dumps
+else:
+    NAME = "json"
+    loads = _std_loads
+    dumps = _std_dumps
+
+# Decode errors raised by either backend (orjson.JSONDecodeError subclasses ValueError)
+DecodeError = ValueError
+
+
+# -----------------------------------------------------------
+# Incremental splitting of a top-level JSON array
+# -----------------------------------------------------------
+_STRUCTURAL = re.compile(rb'[\[\]{}"]')
+_STRING_END = re.compile(rb'["\\]')
+
+
+class JsonArrayStream:
+    """Split a streamed `[{...}, {...}, ...]` body into its elements.
+
+    `feed(chunk)` returns the raw bytes of every element completed by the
+    chunk; decode them with `loads`. Only the current partial element is
+    buffered, so memory stays bounded by the largest single element rather
+    than the whole body. Elements must be objects or arrays.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._opened = False
+        self.closed = False
+
+    def feed(self, chunk: bytes) -> list:
+        out = []
+        if self.closed:
+            return out
+        buf = self._buf
+        buf += chunk
+        pos = self._pos
+
+        while True:
+            if self._in_string:
+                m = _STRING_END.search(buf, pos)
+                if not m:
+                    pos = len(buf)
+                    break
+                if buf[m.start()] == 0x5C:  # backslash: skip the escaped byte
+                    if m.start() + 1 >= len(buf):
+                        pos = m.start()
+                        break
+                    pos = m.start() + 2
+                    continue
+                self._in_string = False
+                pos = m.end()
+                continue
+
+            m = _STRUCTURAL.search(buf, pos)
+            if not m:
+                pos = len(buf)
+                break
+            c = buf[m.start()]
+            pos = m.end()
+
+            if c == 0x22:  # "
+                self._in_string = True
+            elif c in (0x5B, 0x7B):  # [ {
+                if not self._opened:
+                    self._opened = True
+                    continue
+                if self._depth == 0:
+                    self._start = m.start()
+                self._depth += 1
+            else:  # ] }
+                if self._depth == 0:
+                    self.closed = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    out.append(bytes(buf[self._start:pos]))
+                    self._start = None
+
+        # Drop everything before the current partial element.
+        keep = self._start if self._start is not None else pos
+        del buf[:keep]
+        self._pos = pos - keep
+        if self._start is not None:
+            self._start = 0
+        return out
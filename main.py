@@ -10,13 +10,11 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import config
 from traccar_client import TraccarClient
+from command_tracker import CommandTracker
 from services import DeviceService
-from tasks import periodic_sim_balance_qssd_task
-from tasks import periodic_simcard_no_task
-from tasks import periodic_getparams_task
-from tasks import periodic_getimsi_task
-from tasks import periodic_getpass_task
+from tasks import periodic_jobs_task, default_jobs
 from database import init_db
+import database
 from api.fota import router as fota_router
 from api.ussd_parser import router as ussd_router
 from api.auth import router as auth_router
@@ -38,51 +36,89 @@ async def lifespan(app: FastAPI):
     
     # Old FTP instances are now killed by the FTP server script itself on startup
 
-    client = TraccarClient(config.BASE_URL, config.TOKEN, verify_ssl=False)
+    client = TraccarClient(
+        config.BASE_URL,
+        config.TOKEN,
+        verify_ssl=False,
+        coalesce_window=config.ATTRIBUTE_COALESCE_WINDOW,
+        max_cache_age=config.DEVICE_CACHE_MAX_AGE,
+        user_index_ttl=config.USER_INDEX_TTL,
+        command_gap=config.COMMAND_DEVICE_GAP,
+        command_release_timeout=config.COMMAND_RELEASE_TIMEOUT,
+        command_concurrency=config.COMMAND_CONCURRENCY,
+        command_rate=config.COMMAND_RATE,
+    )
     app.state.client = client
+
+    # Match command results to the commands that asked for them; unanswered
+    # commands are resent while the device is online. Answers (and final
+    # timeouts) release the device's next queued command.
+    client.tracker = CommandTracker(
+        resend=lambda device_id, data: client.send_command(device_id, data, track=False, retry=True),
+        timeout=config.COMMAND_RESPONSE_TIMEOUT,
+        max_retries=config.COMMAND_MAX_RETRIES,
+        backoff=config.COMMAND_RETRY_BACKOFF,
+        is_online=lambda device_id: client.registry.status(device_id) == "online",
+        on_settled=client.command_queue.settled if client.command_queue else None,
+    )
+    client.tracker.start()
        
     # Initialize service
-    service = DeviceService(client)
+    # Shared by the periodic scheduler and the deviceOnline catch-up
+    periodic_jobs = default_jobs()
+    service = DeviceService(
+        client,
+        lane_parallelism=config.EVENT_LANE_PARALLELISM,
+        lane_max_pending=config.EVENT_LANE_MAX_PENDING,
+        backfill_batch_size=config.BACKFILL_BATCH_SIZE,
+        backfill_max_gap=config.BACKFILL_MAX_GAP,
+        dedup_ttl=config.EVENT_DEDUP_TTL,
+        dedup_max_entries=config.EVENT_DEDUP_MAX_ENTRIES,
+        provision_delay=config.PROVISION_GETVER_DELAY,
+        periodic_jobs=periodic_jobs,
+    )
+    if config.EVENT_DEDUP_PERSIST:
+        service.event_dedup.load(database.load_seen_events())
 
     # Pre-fetch the device list BEFORE the WS listener starts, so any
     # deviceOnline event for an unknown device is correctly flagged as new.
     await service.load_known_devices()
+    # Resume provisioning steps left pending by the previous run
+    service.provisioning.start()
 
     # Start WebSocket
     # We pass the service.handle_ws_message as the callback
-    ws_task = asyncio.create_task(client.listen_socket(on_message=service.handle_ws_message))
-
-    # Start Periodic Task
-    qssd_task = asyncio.create_task(periodic_sim_balance_qssd_task(client))
-    simcard_no_task = asyncio.create_task(periodic_simcard_no_task(client))
-    getparams_task = asyncio.create_task(periodic_getparams_task(client))
-    getimsi_task = asyncio.create_task(periodic_getimsi_task(client))
-    getpass_task = asyncio.create_task(periodic_getpass_task(client))
+    ws_task = asyncio.create_task(client.listen_socket(
+        on_message=service.handle_ws_message,
+        workers=config.WS_WORKERS,
+        queue_size=config.WS_QUEUE_SIZE,
+        frame_filter=service.accept_frame,
+        on_connect=service.on_socket_connected,
+    ))
+
+    # Start Periodic Tasks (qssd, SIMCARD No, getparams, getimsi, getpass)
+    periodic_task = asyncio.create_task(periodic_jobs_task(client, periodic_jobs))
+    resync_task = asyncio.create_task(service.resync_devices_task(config.DEVICE_RESYNC_INTERVAL))
 
     # Initial Device Check & Command Sending
     try:
-        devices = await client.get_devices()
-
-        t950_devices = [
-            d for d in devices
-            if d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950"
-        ]
+        t950_devices = await client.find_devices(model="T950")
 
         print(f"\n✅ Found {len(t950_devices)} T950 devices\n")
 
         # Send ALLPARAMS request only to online devices
         # (Original code logic preserved)
-        for dev in t950_devices:
-            dev_id = dev["id"] 
-            status = dev.get("status")
-
-            if status == "online":
-                try:
-                    resp = await client.send_command(dev_id, "bacmd:ALLPARAMS")
-                    print("✅ Sent ALLPARAMS CMD:", resp)
-                    # print("-------------------")
-                except Exception as e:
-                    print(f"❌ Failed to send ALLPARAMS to {dev_id}: {e}")
+        commands = [
+            (dev["id"], "bacmd:ALLPARAMS")
+            for dev in t950_devices
+            if dev.get("status") == "online"
+        ]
+        results = await client.send_commands(commands)
+        for r in results:
+            if r["ok"]:
+                print("✅ Sent ALLPARAMS CMD:", r["result"])
+            else:
+                print(f"❌ Failed to send ALLPARAMS to {r['device_id']}: {r['error']}")
 
         print("\n✅ WebSocket live. Waiting for events...\n")
 
@@ -101,28 +137,36 @@ async def lifespan(app: FastAPI):
     
     if ws_task:
         ws_task.cancel()
-    if qssd_task:
-        qssd_task.cancel()
-    if simcard_no_task:
-        simcard_no_task.cancel()
-    if getparams_task:
-        getparams_task.cancel()
-    if getimsi_task:
-        getimsi_task.cancel()
-    if getpass_task:
-        getpass_task.cancel()
+    if periodic_task:
+        periodic_task.cancel()
+    resync_task.cancel()
 
     # Wait for completion of cancelled tasks to avoid "Task was destroyed" warnings
     await asyncio.gather(
         ws_task,
-        qssd_task,
-        simcard_no_task,
-        getparams_task,
-        getimsi_task,
-        getpass_task,
+        periodic_task,
+        resync_task,
         return_exceptions=True
     )
 
+    # Finish WS frames already queued, then stop handler background tasks
+    if client:
+        await client.stop_socket_queue()
+    await service.shutdown()
+    print(f"📊 WS frames: {service.frame_stats()}")
+    print(f"📊 Event dedup: {service.event_dedup.stats()}")
+    print(f"📊 Command results: {service.dispatcher.stats()}")
+    print(f"📊 Param store: {service.params.stats()}")
+    print(f"📊 Provisioning: {service.provisioning.stats()}")
+    print(f"📊 Device writes: {client.write_stats()}")
+    await client.tracker.stop()
+    print(f"📊 Command round trips: {client.tracker.stats()}")
+    if client.command_queue:
+        await client.command_queue.stop()
+        print(f"📊 Device command queue: {client.command_queue.stats()}")
+    if config.EVENT_DEDUP_PERSIST:
+        database.save_seen_events(service.event_dedup.entries())
+
     if client:
         await client.close()
     
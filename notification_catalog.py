@@ -0,0 +1,133 @@
+# notification_catalog.py
+import asyncio
+import logging
+from traccar_client import TraccarClient
+
+logger = logging.getLogger("notifications")
+
+
+def make_notif(ntype, notificators, attributes):
+    """Build a notification definition matching the PHP structure: id=-1, always=True."""
+    return {
+        "id": -1,
+        "type": ntype,
+        "always": True,
+        "notificators": notificators,
+        "attributes": attributes
+    }
+
+
+# Standard notifications every user gets
+STANDARD_NOTIFICATIONS = [
+    make_notif("ignitionOn", "web", {}),
+    make_notif("ignitionOff", "web", {}),
+    make_notif("deviceUnknown", "web", {}),
+    make_notif("commandResult", "web", {}),
+    make_notif("deviceOnline", "web", {}),
+    make_notif("deviceOffline", "web", {}),
+    make_notif("deviceStopped", "web", {}),
+    make_notif("deviceMoving", "web", {}),
+
+    make_notif("ignitionOn", "firebase", {}),
+    make_notif("ignitionOff", "firebase", {}),
+
+    make_notif("alarm", "web", {"alarms": "idle"}),
+    make_notif("alarm", "web", {"alarms": "overspeed"}),
+    make_notif("alarm", "web", {"alarms": "powerCut"}),
+    make_notif("alarm", "web", {"alarms": "vibration"}),
+    make_notif("alarm", "web", {"alarms": "lowPower"}),
+    make_notif("alarm", "web", {"alarms": "tow"}),
+
+    make_notif("alarm", "firebase", {"alarms": "idle"}),
+    make_notif("alarm", "firebase", {"alarms": "overspeed"}),
+    make_notif("alarm", "firebase", {"alarms": "powerCut"}),
+    make_notif("alarm", "firebase", {"alarms": "vibration"}),
+    make_notif("alarm", "firebase", {"alarms": "lowPower"}),
+    make_notif("alarm", "firebase", {"alarms": "tow"}),
+]
+
+
+def _notif_key(notif: dict):
+    attrs = notif.get("attributes") or {}
+    return (
+        notif.get("type"),
+        notif.get("notificators"),
+        bool(notif.get("always")),
+        attrs.get("alarms"),
+    )
+
+
+class NotificationCatalog:
+    """Shared set of the standard notifications, created once and linked per user.
+
+    Instead of creating 22 new notification objects for every signup, the
+    standard definitions exist once on the server. Their ids are resolved the
+    first time they are needed (matching existing notifications, creating only
+    the missing ones) and cached for the life of the process. If any of them
+    could not be created, nothing is cached and the next call tries again.
+    """
+
+    def __init__(self, definitions=None, link_concurrency: int = 8):
+        self.definitions = definitions or STANDARD_NOTIFICATIONS
+        self.link_concurrency = link_concurrency
+        self._ids = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_ids(self, client: TraccarClient) -> list:
+        """Ids of the standard notifications, creating any that don't exist yet."""
+        if self._ids is not None:
+            return self._ids
+
+        async with self._lock:
+            if self._ids is not None:
+                return self._ids
+
+            existing = {}
+            for notif in await client.get_notifications():
+                existing.setdefault(_notif_key(notif), notif.get("id"))
+
+            ids = []
+            complete = True
+            for nd in self.definitions:
+                notif_id = existing.get(_notif_key(nd))
+                if not notif_id:
+                    try:
+                        notif = await client.create_notification(nd)
+                        notif_id = notif.get("id")
+                        existing[_notif_key(nd)] = notif_id
+                    except Exception as e:
+                        logger.warning(f"Failed to create notification {nd['type']}: {e}")
+                        complete = False
+                        continue
+                if notif_id:
+                    ids.append(notif_id)
+                else:
+                    complete = False
+
+            if not complete:
+                # Link what we have, but retry the missing ones next time
+                logger.warning(f"Notification catalog incomplete: {len(ids)}/{len(self.definitions)} notifications")
+                return ids
+            self._ids = ids
+            logger.info(f"Notification catalog ready: {len(ids)} notifications")
+            return ids
+
+    async def link_user(self, client: TraccarClient, user_id: int) -> int:
+        """Link every standard notification to `user_id`; returns how many links succeeded."""
+        ids = await self.ensure_ids(client)
+        sem = asyncio.Semaphore(max(1, self.link_concurrency))
+
+        async def link(notif_id):
+            async with sem:
+                try:
+                    await client.add_permission_generic("permissions", "userId", user_id, "notificationId", notif_id)
+                    return True
+                except Exception as e:
+                    logger.warning(f"Failed to link notification {notif_id} to user {user_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(link(i) for i in ids))
+        return sum(results)
+
+
+catalog = NotificationCatalog()
@@ -0,0 +1,98 @@
+# param_store.py
+import time
+import database
+
+# Attribute names the parameter sets are mirrored to in Traccar
+ALLPARAMS = "baallparams"
+TRACKERPARAMS = "trackerparams"
+
+
+def format_params(params: dict) -> str:
+    """Inverse of `utils.parse_params`: {100: "200", 101: "300"} -> "100:200;101:300;"."""
+    if not params:
+        return ""
+    return ";".join(f"{k}:{params[k]}" for k in sorted(params)) + ";"
+
+
+class ParamStore:
+    """Per-device parameter values, indexed by (device, kind, param_id).
+
+    Backed by the `device_params` table, with the sets in use kept in memory,
+    so applying a response only compares the params it carries instead of
+    re-parsing and re-sorting the whole attribute blob. `diff` returns only
+    the params whose value changed; callers skip the Traccar write when
+    nothing did, and `commit` the diff (stamping `changed_at`) only after
+    the write succeeded, so a failed PUT is retried when the response
+    arrives again.
+    """
+
+    def __init__(self):
+        self._sets: dict = {}   # (device_id, kind) -> {param_id: value}
+        self.changed = 0
+        self.unchanged = 0
+
+    def _load(self, device_id: int, kind: str):
+        key = (device_id, kind)
+        if key not in self._sets:
+            rows = database.load_device_params(device_id, kind)
+            self._sets[key] = {param_id: value for param_id, value in rows} if rows else None
+        return self._sets[key]
+
+    def has(self, device_id: int, kind: str) -> bool:
+        return self._load(device_id, kind) is not None
+
+    def get(self, device_id: int, kind: str) -> dict:
+        return dict(self._load(device_id, kind) or {})
+
+    def seed(self, device_id: int, kind: str, params: dict):
+        """Record the values already stored in Traccar, without counting them as changes."""
+        self._sets[(device_id, kind)] = dict(params)
+        database.save_device_params(device_id, kind, params.items(), time.time())
+
+    def diff(self, device_id: int, kind: str, params: dict, full: bool = False) -> dict:
+        """Params whose value would change; nothing is saved until `commit`.
+
+        `full` treats `params` as the complete list, so params missing from
+        it are reported as removed (mapped to None).
+        """
+        current = self._load(device_id, kind) or {}
+        changed = {k: v for k, v in params.items() if current.get(k) != v}
+        if full:
+            changed.update((k, None) for k in current if k not in params)
+        if not changed:
+            self.unchanged += 1
+        return changed
+
+    def applied(self, device_id: int, kind: str, changed: dict) -> dict:
+        """The set as it would be after `commit(changed)`."""
+        out = self.get(device_id, kind)
+        for k, v in changed.items():
+            if v is None:
+                out.pop(k, None)
+            else:
+                out[k] = v
+        return out
+
+    def commit(self, device_id: int, kind: str, changed: dict):
+        """Save a diff returned by `diff`, once it has been written to Traccar."""
+        if not changed:
+            return
+        self.changed += 1
+        current = self._load(device_id, kind)
+        if current is None:
+            current = self._sets[(device_id, kind)] = {}
+        updates = {k: v for k, v in changed.items() if v is not None}
+        removed = [k for k, v in changed.items() if v is None]
+        current.update(updates)
+        for k in removed:
+            current.pop(k, None)
+        database.save_device_params(device_id, kind, updates.items(), time.time())
+        if removed:
+            database.delete_device_params(device_id, kind, removed)
+
+    def stats(self) -> dict:
+        return {
+            "sets": len(self._sets),
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+        }
@@ -0,0 +1,90 @@
+# provision_scheduler.py
+import asyncio
+import heapq
+import time
+import database
+
+
+class ProvisionScheduler:
+    """Persistent timer heap for delayed per-device provisioning steps.
+
+    `schedule(device_id, step, delay)` records the step in the
+    `provision_jobs` table and on an in-memory heap; one runner task sleeps
+    until the earliest due time and hands every due step to
+    `run_step(device_id, step)`. Onboarding thousands of devices costs one
+    heap entry each instead of one sleeping task each, and `start()` reloads
+    the steps still pending after a restart. Rescheduling a (device, step)
+    pair replaces its earlier due time.
+    """
+
+    def __init__(self, run_step, name: str = "provisioning"):
+        self._run_step = run_step
+        self.name = name
+        self._heap: list = []     # (due_at, seq, device_id, step)
+        self._due: dict = {}      # (device_id, step) -> due_at (latest wins)
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.scheduled = 0
+        self.fired = 0
+        self.errors = 0
+
+    def _push(self, device_id: int, step: str, due_at: float):
+        self._due[(device_id, step)] = due_at
+        self._seq += 1
+        heapq.heappush(self._heap, (due_at, self._seq, device_id, step))
+
+    def start(self):
+        if self._task is None:
+            for device_id, step, due_at in database.load_provision_jobs():
+                self._push(device_id, step, due_at)
+            if self._due:
+                print(f"⏰ {self.name}: resumed {len(self._due)} pending steps")
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, device_id: int, step: str, delay: float = 0):
+        due_at = time.time() + delay
+        database.save_provision_job(device_id, step, due_at)
+        self._push(device_id, step, due_at)
+        self.scheduled += 1
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due_at, _, device_id, step = heapq.heappop(self._heap)
+                if self._due.get((device_id, step)) != due_at:
+                    continue  # rescheduled since; a later entry covers it
+                del self._due[(device_id, step)]
+                database.delete_provision_job(device_id, step)
+                self.fired += 1
+                try:
+                    await self._run_step(device_id, step)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ {self.name}: step {step} for device {device_id} failed: {e}")
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        """Stop the runner; pending steps stay in the DB for the next start."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._due),
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "errors": self.errors,
+        }
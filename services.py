@@ -1,12 +1,17 @@
 import json
 import re
 import asyncio
+import json_codec
 from typing import Optional
-from collections import deque
-from utils import parse_params
-from datetime import datetime
 from utils import parse_params
+from datetime import datetime, timedelta, timezone
 from traccar_client import TraccarClient
+from work_queue import KeyedLanes
+from event_dedup import EventDeduplicator
+from command_dispatch import CommandDispatcher
+from provision_scheduler import ProvisionScheduler
+from vehicle_names import VehicleNumberIndex
+from param_store import ParamStore, ALLPARAMS, TRACKERPARAMS, format_params
 
 # Helper function for device type mapping
 def device_type_to_model(device_type):
@@ -18,24 +23,121 @@ def device_type_to_model(device_type):
     if dt == 92: return "TYNOR-T920"
     return "unknown"
 
+# Event types re-fetched from the events report after a WS reconnect
+BACKFILL_EVENT_TYPES = ("commandResult",)
+
+# Top-level frame keys we act on. Frames carrying neither (the bulk of the
+# traffic: position-only updates) are dropped before they are parsed.
+HANDLED_FRAME_KEYS = ('"events"', '"devices"')
+
+
+def parse_param_id_result(result: str) -> str:
+    """Turn "Param ID:17703 Value:0;17603:0;..." into "17703:0;17603:0;..."."""
+    # split into header and tail by 'Value:'
+    parts = result.split("Value:", 1)
+    header = parts[0].strip()  # e.g. "Param ID:17703"
+    tail = parts[1].strip() if len(parts) > 1 else ""
+
+    # extract id number from header
+    # header format expected "Param ID:17703" (may have spaces)
+    id_part = header.replace("Param ID:", "").strip()
+    if not id_part:
+        raise ValueError("missing param id")
+    # first value is before first ';' in tail (or whole tail if no ;)
+    if ";" in tail:
+        first_value, rest = tail.split(";", 1)
+        rest = rest.strip()
+    else:
+        first_value = tail
+        rest = ""
+
+    first_value = first_value.strip()
+    # construct final params: "17703:0;rest..."
+    final_params = f"{id_part}:{first_value}"
+    if rest:
+        final_params = final_params + ";" + rest
+    return final_params
+
+
+def parse_event_time(value) -> Optional[datetime]:
+    """Parse Traccar's eventTime ("2024-05-01T10:20:30.000+00:00") to an aware datetime."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
 class DeviceService:
-    def __init__(self, client: TraccarClient):
+    # Provisioning step name -> method run when the step comes due
+    PROVISION_STEPS = {
+        "getver": "_provision_getver",
+        "sim": "_provision_sim",
+    }
+
+    def __init__(self, client: TraccarClient, lane_parallelism: int = 16, lane_max_pending: int = 5000,
+                 backfill_batch_size: int = 50, backfill_max_gap: float = 6 * 3600,
+                 dedup_ttl: float = 6 * 3600, dedup_max_entries: int = 200000,
+                 provision_delay: float = 120, periodic_jobs: list = None):
         self.client = client
-        self.recent_event_ids = deque(maxlen=100)
+        # Event handlers run in per-device lanes: in order for one device,
+        # in parallel across devices.
+        self.lanes = KeyedLanes(parallelism=lane_parallelism, max_pending=lane_max_pending, name="event lanes")
+        self.event_dedup = EventDeduplicator(ttl=dedup_ttl, max_entries=dedup_max_entries)
+        # Command results are routed by prefix; see `_register_result_handlers`.
+        self.dispatcher = CommandDispatcher(on_match=self._on_command_result)
+        self._register_result_handlers()
+        # Last known ALLPARAMS / TRACKERPARAMS values; Traccar is only written
+        # when a response actually changes one of them.
+        self.params = ParamStore()
+        # Delayed new-device provisioning steps, persisted across restarts;
+        # each due step runs as a background task, off the device's lane (its
+        # paced sends wait for replies handled there). See `PROVISION_STEPS`.
+        self.provisioning = ProvisionScheduler(self._run_provision_step)
+        self.provision_delay = provision_delay
+        # Periodic sweep jobs (tasks.default_jobs); known devices coming online
+        # are sent the commands they are overdue for. See `tasks.catch_up_device`.
+        self.periodic_jobs = periodic_jobs or []
         self.device_names = {}
+        # user id -> highest "خودرو N" in use; see `generate_device_name`.
+        self.vehicle_numbers = VehicleNumberIndex()
         self.known_device_ids: set = set()
+        # Long-lived tasks (e.g. delayed provisioning) started from WS handlers;
+        # kept so they can be cancelled on shutdown.
+        self._background: set = set()
+        # WS frame prefilter counters; see `accept_frame`.
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.bytes_skipped = 0
+        # Newest eventTime processed; the starting point for backfilling a
+        # reconnect gap (at most `backfill_max_gap` seconds back).
+        self.last_event_time: Optional[datetime] = None
+        self._socket_connects = 0
+        self.backfill_batch_size = backfill_batch_size
+        self.backfill_max_gap = backfill_max_gap
 
     async def load_known_devices(self):
-        """Pre-fetch the current device list so we can detect newly added ones later."""
-        devices = await self.client.get_devices()
-        self.known_device_ids = {d["id"] for d in devices if d.get("id")}
+        """Pre-fetch the current device list so we can detect newly added ones later.
+
+        This also loads the client's device registry, which the WS `devices`
+        frames keep current from then on.
+        """
+        await self.client.load_devices()
+        self.known_device_ids = self.client.registry.ids()
         print(f"✅ Pre-fetched {len(self.known_device_ids)} known devices.")
 
     # -----------------------------------------------------------
     # Handle a device coming online — detect newly added devices
     # -----------------------------------------------------------
     async def _handle_device_online(self, device_id: int):
-        if not device_id or device_id in self.known_device_ids:
+        if not device_id:
+            return
+        if device_id in self.known_device_ids:
+            # Runs outside the device's lane: paced sends can wait for replies,
+            # and those replies are handled on that lane.
+            self._spawn(self._catch_up_device(device_id))
             return
         self.known_device_ids.add(device_id)
         try:
@@ -49,24 +151,64 @@ class DeviceService:
 
         # Kick off the new-device provisioning sequence. It starts by asking the
         # device for its firmware/model (getver) after a 2-minute settle delay.
-        asyncio.create_task(self._provision_new_device(device_id))
+        self.provisioning.schedule(device_id, "getver", self.provision_delay)
+
+    async def _catch_up_device(self, device_id: int):
+        if not self.periodic_jobs:
+            return
+        from tasks import catch_up_device
+        try:
+            dev = await self.client.get_device(device_id)
+            await catch_up_device(self.client, dev, self.periodic_jobs)
+        except Exception as e:
+            print(f"❌ Catch-up failed for device {device_id}: {e}")
 
     # -----------------------------------------------------------
     # New-device provisioning sequence
     # -----------------------------------------------------------
-    async def _provision_new_device(self, device_id: int, delay: int = 120):
-        """Wait for the device to settle, then request its version.
+    async def _run_provision_step(self, device_id: int, step: str):
+        handler = getattr(self, self.PROVISION_STEPS.get(step, ""), None)
+        if handler is None:
+            print(f"⚠️ Unknown provisioning step {step!r} for device {device_id}")
+            return
+        # Off the device's lane, like catch-up: the paced sends below wait
+        # for the previous command's reply, which is handled on that lane.
+        self._spawn(handler(device_id))
+
+    async def _provision_getver(self, device_id: int):
+        """Request the device version once it has settled.
 
         The `getver` response (handled in `handle_version_response`) drives the
         rest of the command sequence.
         """
-        await asyncio.sleep(delay)
         try:
             await self.client.send_command(device_id, "getver")
-            print(f"📦 Sent getver to new device {device_id} (after {delay}s)")
+            print(f"📦 Sent getver to new device {device_id}")
         except Exception as e:
             print(f"❌ Failed to send getver to {device_id}: {e}")
 
+    async def _provision_sim(self, device_id: int):
+        # If we don't yet have the SIM's IMSI on file, ask the device for it.
+        try:
+            dev = await self.client.get_device(device_id)
+        except Exception as e:
+            print(f"❌ Failed to fetch device {device_id} for SIM provisioning: {e}")
+            return
+        imsi = str(dev.get("attributes", {}).get("imsi", "")).strip()
+        if not imsi:
+            try:
+                await self.client.send_command(device_id, "getimsi")
+                print(f"📨 No IMSI on file — sent getimsi to device {device_id}")
+            except Exception as e:
+                print(f"❌ Failed to send getimsi to {device_id}: {e}")
+        else:
+            print(f"⏭️ IMSI already known for device {device_id} ({imsi}) — running SIM provisioning")
+            # IMSI is on file, so run the SIM-card discovery steps for this device:
+            # request the SIMCARD No (if missing) and a balance check.
+            await self._discover_sim(dev)
+
+        # TODO: continue the provisioning command sequence here.
+
     # -----------------------------------------------------------
     # Handle getver response: "VERSION:2.1.0d MODEL:50/2"
     # -----------------------------------------------------------
@@ -83,30 +225,9 @@ class DeviceService:
             device_id, {"firmware": version, "hw_model": model}
         )
 
-        # If we don't yet have the SIM's IMSI on file, ask the device for it.
-        dev = await self.client.get_device(device_id)
-        imsi = str(dev.get("attributes", {}).get("imsi", "")).strip()
-        if not imsi:
-            try:
-                await self.client.send_command(device_id, "getimsi")
-                print(f"📨 No IMSI on file — sent getimsi to device {device_id}")
-            except Exception as e:
-                print(f"❌ Failed to send getimsi to {device_id}: {e}")
-        else:
-            print(f"⏭️ IMSI already known for device {device_id} ({imsi}) — running SIM provisioning")
-            # IMSI is on file, so run the SIM-card discovery steps for this device:
-            # request the SIMCARD No (if missing) and a balance check.
-            from tasks import simcard_no_check_for_device, sim_balance_qssd_for_device
-            try:
-                await simcard_no_check_for_device(self.client, dev)
-            except Exception as e:
-                print(f"❌ simcard_no_check failed for {device_id}: {e}")
-            try:
-                await sim_balance_qssd_for_device(self.client, dev)
-            except Exception as e:
-                print(f"❌ sim_balance_qssd failed for {device_id}: {e}")
-
-        # TODO: continue the provisioning command sequence here.
+        # SIM discovery is the next step; it goes through the scheduler so it
+        # is not lost if we restart before it runs.
+        self.provisioning.schedule(device_id, "sim")
 
     async def get_device_name(self, device_id: int):
         if not device_id:
@@ -129,102 +250,106 @@ class DeviceService:
     # -----------------------------------------------------------
     async def save_allparams(self, device_id: int, params: str):
         print(f"💾 Saving ALLPARAMS for device {device_id}")
-        await self.client.update_device_attributes(device_id, {"baallparams": params})
+        await self._apply_params(device_id, ALLPARAMS, parse_params(params), full=True)
 
     # -----------------------------------------------------------
     # Update based on PARAM SET (partial update)
     # -----------------------------------------------------------
     async def update_params(self, device_id: int, param_string: str):
         print(f"🔧 Incremental parameter update for device {device_id}")
-
-        new_params = parse_params(param_string)
-
-        dev = await self.client.get_device(device_id)
-        attrs = dev.get("attributes", {})
-
-        stored = attrs.get("baallparams", "")
-        stored_dict = parse_params(stored)
-
-        # merge
-        stored_dict.update(new_params)
-
-        # string format sorted by key
-        merged = ";".join(f"{k}:{stored_dict[k]}" for k in sorted(stored_dict)) + ";"
-
-        print(f"✅ Updated merged parameters for device {device_id}:")
-        print(merged)
-
-        await self.client.update_device_attributes(device_id, {"baallparams": merged})
+        merged = await self._apply_params(device_id, ALLPARAMS, parse_params(param_string))
+        if merged is not None:
+            print(f"✅ Updated merged parameters for device {device_id}:")
+            print(merged)
 
     # -----------------------------------------------------------
     # Save TRACKERPARAMS (READ: Param ID:.... Value:...)
     # -----------------------------------------------------------
     async def save_trackerparams(self, device_id: int, params: str):
         print(f"💾 Saving TRACKERPARAMS (full) for device {device_id}")
-        await self.client.update_device_attributes(device_id, {"trackerparams": params})
+        await self._apply_params(device_id, TRACKERPARAMS, parse_params(params), full=True)
 
     # -----------------------------------------------------------
     # Update TRACKERPARAMS (WRITE: New value 2001:aaa;2002:bbb)
     # -----------------------------------------------------------
     async def update_trackerparams(self, device_id: int, param_string: str):
         print(f"🔧 Updating TRACKERPARAMS (partial) for device {device_id}")
+        merged = await self._apply_params(device_id, TRACKERPARAMS, parse_params(param_string))
+        if merged is None:
+            return
 
-        new_params = parse_params(param_string)
+        print(f"✅ Updated trackerparams for device {device_id}")
+        print(merged)
 
-        dev = await self.client.get_device(device_id)
-        attrs = dev.get("attributes", {})
+    async def _apply_params(self, device_id: int, kind: str, params: dict, full: bool = False):
+        """Diff `params` against the param store and mirror changes to Traccar.
 
-        stored = attrs.get("trackerparams", "")
-        stored_dict = parse_params(stored)
+        `full` replaces the whole set (ALLPARAMS / Param ID reads); otherwise
+        the params are merged in. Returns the attribute string written, or
+        None when no value changed and Traccar was left alone.
+        """
+        if not self.params.has(device_id, kind):
+            # First time we see this set: start from what Traccar already has.
+            dev = await self.client.get_device(device_id)
+            stored = (dev or {}).get("attributes", {}).get(kind, "")
+            self.params.seed(device_id, kind, parse_params(stored))
 
-        stored_dict.update(new_params)
+        changed = self.params.diff(device_id, kind, params, full=full)
+        if not changed:
+            print(f"⏭️ {kind} unchanged for device {device_id}, skipping update.")
+            return None
 
-        merged = ";".join(f"{k}:{stored_dict[k]}" for k in sorted(stored_dict)) + ";"
+        value = format_params(self.params.applied(device_id, kind, changed))
 
-        print(f"✅ Updated trackerparams for device {device_id}")
-        print(merged)
-
-        await self.client.update_device_attributes(device_id, {"trackerparams": merged})
+        def apply(attrs):
+            if attrs.get(kind) == value:
+                return None
+            attrs[kind] = value
+            return attrs
 
-        await self.client.update_device_attributes(device_id, {"trackerparams": merged})
+        # Only remember the new values once Traccar has them; if the PUT
+        # fails, the same response is diffed (and written) again next time.
+        await self.client.modify_device_attributes(device_id, apply)
+        self.params.commit(device_id, kind, changed)
+        return value
 
     # -----------------------------------------------------------
     # Update IMSI
     # -----------------------------------------------------------
     async def update_imsi(self, device_id: int, imsi: str):
-        dev = await self.client.get_device(device_id)
-        attrs = dev.get("attributes", {})
-        current_imsi = str(attrs.get("imsi", "")).strip()
         new_imsi = str(imsi).strip()
-
-        if current_imsi == new_imsi:
+        previous = {}
+
+        def apply(attrs):
+            current_imsi = str(attrs.get("imsi", "")).strip()
+            if current_imsi == new_imsi:
+                return None
+
+            # IMSI changed => clear SIMCARD No so it can be re-discovered.
+            for key in ("SIMCARD No", "simcard_no", "simcardNo", "simcard"):
+                attrs.pop(key, None)
+            attrs["imsi"] = new_imsi
+            previous["imsi"] = current_imsi
+            print(f"💾 Saving IMSI {new_imsi} for device {device_id} (was: {current_imsi or 'empty'})")
+            return attrs
+
+        dev = await self.client.modify_device_attributes(device_id, apply)
+        if "imsi" not in previous:
             print(f"⏭️ IMSI unchanged for device {device_id}, skipping update.")
             return
 
-        # IMSI changed => clear SIMCARD No so it can be re-discovered.
-        for key in ("SIMCARD No", "simcard_no", "simcardNo", "simcard"):
-            attrs.pop(key, None)
-        attrs["imsi"] = new_imsi
-
-        print(f"💾 Saving IMSI {new_imsi} for device {device_id} (was: {current_imsi or 'empty'})")
-        payload = {
-            "id": device_id,
-            "name": dev["name"],
-            "uniqueId": dev["uniqueId"],
-            "status": dev.get("status"),
-            "model": dev.get("model"),
-            "groupId": dev.get("groupId"),
-            "contact": dev.get("contact"),
-            "category": dev.get("category"),
-            "attributes": attrs,
-        }
-        await self.client.update_device(device_id, payload)
-
         # IMSI just changed (SIMCARD No was cleared above), so kick off SIM-card
         # discovery right away: request the SIMCARD No and a balance check.
-        # `dev["attributes"]` is `attrs`, which already reflects the new IMSI and
+        # `dev` is the device as saved, which already reflects the new IMSI and
         # the cleared SIMCARD No, so the helpers act on fresh state.
+        # Spawned: update_imsi runs on the device's lane, and the paced sends
+        # would hold it until the device answers (an answer the lane handles).
+        self._spawn(self._discover_sim(dev))
+
+    async def _discover_sim(self, dev: dict):
+        """Request the SIMCARD No (if missing) and a balance check for `dev`."""
         from tasks import simcard_no_check_for_device, sim_balance_qssd_for_device
+        device_id = dev.get("id")
         try:
             await simcard_no_check_for_device(self.client, dev)
         except Exception as e:
@@ -238,33 +363,15 @@ class DeviceService:
     # Generate Device Name (Python port of PHP logic)
     # -----------------------------------------------------------
     async def generate_device_name(self, user_id: int):
-        devices = await self.client.get_devices({"userId": user_id})
-        
-        last_device_id = 0
-        last_device_name = ""
-        
-        for item in devices:
-            name = item.get("name", "")
-            # Check if name starts with "خودرو"
-            # PHP: explode(" ", $item->name)[0] == "خودرو"
-            parts = name.split(" ")
-            if len(parts) > 0 and parts[0] == "خودرو":
-                if item["id"] > last_device_id:
-                    last_device_id = item["id"]
-                    last_device_name = name
-                    
-        if last_device_name:
-            parts = last_device_name.split(" ")
-            if len(parts) > 1 and parts[0] == "خودرو":
-                try:
-                    num = int(parts[1])
-                    return f"{parts[0]} {num + 1}"
-                except ValueError:
-                    return "خودرو 1"
-            else:
-                 return "خودرو 1"
-        else:
-            return "خودرو 1"
+        """Next free "خودرو N" name for `user_id` (highest N in use + 1).
+
+        Only the first call for a user lists their devices; after that the
+        per-user index answers directly.
+        """
+        if not self.vehicle_numbers.loaded(user_id):
+            devices = await self.client.get_devices({"userId": user_id})
+            self.vehicle_numbers.load(user_id, devices)
+        return self.vehicle_numbers.next_name(user_id)
 
     # -----------------------------------------------------------
     # Handle Registration Event (CMD 29)
@@ -306,12 +413,6 @@ class DeviceService:
                 # Let's assume user_id is zero if missing?
                 user_id = 0 
                 
-            # Generate Name
-            if user_id:
-                 new_name = await self.generate_device_name(user_id)
-            else:
-                 new_name = f"Device {device_id}" # Fallback
-            
             # Map Model
             new_model = device_type_to_model(device_type) if device_type else dev.get("model")
             
@@ -324,30 +425,221 @@ class DeviceService:
             attrs["hw_rev"] = hardware_revision
             attrs["Device Password"] = device_password
             
-            # Prepare update payload
-            # We want to update name, model, and attributes.
-            device_update = {
-                "id": device_id,
-                "name": new_name,
-                "uniqueId": dev["uniqueId"], # Required usually
-                "model": new_model,
-                "attributes": attrs,
-                "groupId": dev.get("groupId"),
-                "phone": dev.get("phone"),
-                "category": dev.get("category"),
-                "disabled": dev.get("disabled", False)
-            }
-            
-            await self.client.update_device(device_id, device_update)
+            # Name and save under the user's naming lock, so two registrations
+            # for the same user can't both pick the same vehicle number.
+            async with self.vehicle_numbers.lock(user_id):
+                # Generate Name
+                if user_id:
+                     new_name = await self.generate_device_name(user_id)
+                else:
+                     new_name = f"Device {device_id}" # Fallback
+
+                # Prepare update payload
+                # We want to update name, model, and attributes.
+                device_update = {
+                    "id": device_id,
+                    "name": new_name,
+                    "uniqueId": dev["uniqueId"], # Required usually
+                    "model": new_model,
+                    "attributes": attrs,
+                    "groupId": dev.get("groupId"),
+                    "phone": dev.get("phone"),
+                    "category": dev.get("category"),
+                    "disabled": dev.get("disabled", False)
+                }
+
+                await self.client.update_device(device_id, device_update)
+                self.vehicle_numbers.observe(user_id, new_name)
             self.device_names[device_id] = new_name
             print(f"✅ Device {device_id} initialized with Name: {new_name}, Model: {new_model}")
 
         except Exception as e:
             print(f"❌ Registration Handler Error: {e}")
 
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def shutdown(self):
+        """Drain the event lanes, then cancel background tasks started from WS handlers."""
+        await self.provisioning.stop()
+        await self.lanes.stop()
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    # -----------------------------------------------------------
+    # Cheap WS frame prefilter (runs before the frame is queued)
+    # -----------------------------------------------------------
+    def accept_frame(self, msg: str) -> bool:
+        """True if the raw frame may hold `events` or `devices`.
+
+        A plain substring scan instead of a JSON parse. It can let through a
+        frame that merely mentions the key inside a value (that frame is then
+        parsed as before), but it never drops one that has it.
+        """
+        self.frames_seen += 1
+        for key in HANDLED_FRAME_KEYS:
+            if key in msg:
+                return True
+        self.frames_skipped += 1
+        self.bytes_skipped += len(msg)
+        return False
+
+    def frame_stats(self) -> dict:
+        return {
+            "seen": self.frames_seen,
+            "skipped": self.frames_skipped,
+            "skipped_bytes": self.bytes_skipped,
+        }
+
+    async def process_event(self, event: dict):
+        """Handle one Traccar event (from the WS stream or a gap backfill)."""
+        device_id = event.get("deviceId")
+        event_id = event.get("id")
+        event_type = event.get("type")
+
+        event_time = parse_event_time(event.get("eventTime"))
+        if event_time and (self.last_event_time is None or event_time > self.last_event_time):
+            self.last_event_time = event_time
+
+        if event_type == "deviceOnline":
+            await self.lanes.submit(device_id, self._handle_device_online(device_id))
+            return
+
+        attrs = event.get("attributes", {})
+        result = attrs.get("result")
+        if not result:
+            return
+
+        if event_id and self.event_dedup.seen(event_id):
+            #print(f"   🛑 Skipping duplicate event {event_id}")
+            return
+
+        device_name = await self.get_device_name(device_id)
+        print(f"✅ Event ID:{event_id} → Device ID:{device_id}  Name:{device_name}")
+        print(result)
+
+        work = self.dispatcher.route(device_id, result)
+        if work is not None:
+            await self.lanes.submit(device_id, work)
+
+    # -----------------------------------------------------------
+    # Command-result handlers (registered on the dispatcher)
+    # -----------------------------------------------------------
+    def _register_result_handlers(self):
+        d = self.dispatcher
+        # Full parameter list
+        d.register("ALLPARAMS:", lambda dev_id, r: self.save_allparams(dev_id, r[len("ALLPARAMS:"):]))
+        # Partial update
+        d.register("PARAM SET:", lambda dev_id, r: self.update_params(dev_id, r[len("PARAM SET:"):]))
+        # READ PARAMS (Param ID:17703 Value:0;17603:0;...)
+        d.register("Param ID:", lambda dev_id, r: self.save_trackerparams(dev_id, parse_param_id_result(r)))
+        # NEW VALUE (WRITE)
+        d.register("New value", lambda dev_id, r: self.update_trackerparams(dev_id, r[len("New value"):].strip()))
+        # VERSION RESPONSE (getver): "VERSION:2.1.0d MODEL:50/2"
+        d.register("VERSION:", self.handle_version_response)
+        d.register("IMSI:", self._on_imsi_result)
+        d.register("PASS:", self._on_pass_result)
+        d.register("{\"cmd\":29", self._on_cmd29_result, name="cmd 29")
+
+    def _on_command_result(self, device_id: int, name: str):
+        # Close the matching outgoing command for round-trip tracking
+        tracker = getattr(self.client, "tracker", None)
+        if tracker:
+            tracker.answered(device_id, name)
+
+    def _on_imsi_result(self, device_id: int, result: str):
+        imsi = result.split(":", 1)[1].strip()
+        if imsi.isdigit():
+            return self.update_imsi(device_id, imsi)
+        return None
+
+    def _on_pass_result(self, device_id: int, result: str):
+        # Device password response
+        device_password = result.split(":", 1)[1].strip()
+        if device_password:
+            return self.client.update_device_attributes(device_id, {"Device Password": device_password})
+        return None
+
+    def _on_cmd29_result(self, device_id: int, result: str):
+        print("Got 29 command response")
+        cmd_res = json.loads(result)
+        if cmd_res.get("cmd") == 29:
+            return self.handle_registration_event(device_id, cmd_res)
+        return None
+
+    # -----------------------------------------------------------
+    # Gap recovery after a WebSocket reconnect
+    # -----------------------------------------------------------
+    async def on_socket_connected(self):
+        """Called by `listen_socket` after every (re)connect.
+
+        Device frames and events sent while the socket was down are never
+        replayed by Traccar. On a reconnect the registry is reloaded (status
+        changes and deleted devices), then the events since the last one we
+        processed are fetched from the events report and fed through
+        `process_event` (which dedups them).
+        """
+        self._socket_connects += 1
+        if self._socket_connects > 1:
+            self._spawn(self._recover_gap())
+        elif self.last_event_time is not None:
+            self._spawn(self.backfill_events(self.last_event_time))
+
+    async def _recover_gap(self):
+        try:
+            await self.resync_devices()
+        except Exception as e:
+            print(f"❌ Device resync failed: {e}")
+        if self.last_event_time is not None:
+            await self.backfill_events(self.last_event_time)
+
+    async def resync_devices(self):
+        """Reload the registry from Traccar; devices it no longer returns are dropped."""
+        before = self.client.registry.ids()
+        await self.client.load_devices()
+        removed = before - self.client.registry.ids()
+        self.known_device_ids -= removed
+        for device_id in removed:
+            self.device_names.pop(device_id, None)
+        print(f"🔄 Resynced {len(self.client.registry)} devices ({len(removed)} removed)")
+
+    async def resync_devices_task(self, interval: float):
+        """Resync every `interval` seconds, for deletions the WS stream never reports."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resync_devices()
+            except Exception as e:
+                print(f"❌ Device resync failed: {e}")
+
+    async def backfill_events(self, since: datetime):
+        now = datetime.now(timezone.utc)
+        since = max(since, now - timedelta(seconds=self.backfill_max_gap))
+        device_ids = sorted(self.client.registry.ids())
+        total = 0
+
+        for i in range(0, len(device_ids), self.backfill_batch_size):
+            batch = device_ids[i:i + self.backfill_batch_size]
+            try:
+                events = await self.client.get_events_report(batch, since, now, types=BACKFILL_EVENT_TYPES)
+            except Exception as e:
+                print(f"❌ Event backfill failed for {len(batch)} devices: {e}")
+                continue
+
+            events.sort(key=lambda e: e.get("eventTime") or "")
+            for event in events:
+                await self.process_event(event)
+            total += len(events)
+
+        print(f"♻️ Backfilled {total} events since {since.isoformat()} for {len(device_ids)} devices")
+
     async def handle_ws_message(self, msg: str):
         try:
-            data = json.loads(msg)
+            data = json_codec.loads(msg)
 
             positions = data.get("positions", [])
             # if positions:
@@ -358,6 +650,10 @@ class DeviceService:
                 device_name = device.get("name", "")
                 if device_id:
                     self.device_names[device_id] = device_name
+                    self.client.registry.put(device)
+                    assignee = (device.get("attributes") or {}).get("assignee")
+                    if assignee:
+                        self.vehicle_numbers.observe(assignee, device_name)
 
             if "events" not in data:
                 return
@@ -365,109 +661,7 @@ class DeviceService:
             # print(f"\n📨 WS Message: {len(data['events'])} events")
 
             for event in data["events"]:
-                device_id = event.get("deviceId")
-                event_id = event.get("id")
-                event_type = event.get("type")
-
-                if event_type == "deviceOnline":
-                    asyncio.create_task(self._handle_device_online(device_id))
-                    continue
-
-                attrs = event.get("attributes", {})
-                result = attrs.get("result")
-                if not result:
-                    continue
-
-                if event_id and event_id in self.recent_event_ids:
-                    #print(f"   🛑 Skipping duplicate event {event_id}")
-                    continue
-                if event_id:
-                    self.recent_event_ids.append(event_id)
-
-                device_name = await self.get_device_name(device_id)
-                print(f"✅ Event ID:{event_id} → Device ID:{device_id}  Name:{device_name}")
-                print(result)
-
-                # Full parameter list
-                if result.startswith("ALLPARAMS:"):
-                    params = result[len("ALLPARAMS:"):]
-                    asyncio.create_task(self.save_allparams(device_id, params))
-                    continue
-
-                # Partial update
-                if result.startswith("PARAM SET:"):
-                    params = result[len("PARAM SET:"):]
-                    asyncio.create_task(self.update_params(device_id, params))
-                    continue
-
-                # READ PARAMS (Param ID:17703 Value:0;17603:0;...)
-                if result.startswith("Param ID:"):
-                    try:
-                        # split into header and tail by 'Value:'
-                        parts = result.split("Value:", 1)
-                        header = parts[0].strip()  # e.g. "Param ID:17703"
-                        tail = parts[1].strip() if len(parts) > 1 else ""
-
-                        # extract id number from header
-                        # header format expected "Param ID:17703" (may have spaces)
-                        id_part = header.replace("Param ID:", "").strip()
-                        # first value is before first ';' in tail (or whole tail if no ;)
-                        if ";" in tail:
-                            first_value, rest = tail.split(";", 1)
-                            rest = rest.strip()
-                        else:
-                            first_value = tail
-                            rest = ""
-
-                        first_value = first_value.strip()
-                        # construct final params: "17703:0;rest..."
-                        final_params = f"{id_part}:{first_value}"
-                        if rest:
-                            final_params = final_params + ";" + rest
-
-                        # schedule save of trackerparams (this message is partial)
-                        asyncio.create_task(self.save_trackerparams(device_id, final_params))
-                    except Exception as e:
-                        print("❌ Param-ID parse error:", e, " | raw:", result)
-                    continue
-
-                # NEW VALUE (WRITE)
-                if result.startswith("New value"):
-                    params = result[len("New value"):].strip()
-                    asyncio.create_task(self.update_trackerparams(device_id, params))
-                    continue
-
-                # VERSION RESPONSE (getver): "VERSION:2.1.0d MODEL:50/2"
-                if result.startswith("VERSION:"):
-                    asyncio.create_task(self.handle_version_response(device_id, result))
-                    continue
-
-                # IMSI RESPONSE
-                if result.startswith("IMSI:"):
-                    imsi = result.split(":", 1)[1].strip()
-                    if imsi.isdigit():
-                        asyncio.create_task(self.update_imsi(device_id, imsi))
-                    continue
-
-                # Device password response
-                if result.startswith("PASS:"):
-                    device_password = result.split(":", 1)[1].strip()
-                    if device_password:
-                        asyncio.create_task(
-                            self.client.update_device_attributes(
-                                device_id, {"Device Password": device_password}
-                            )
-                        )
-                    continue
-
-                if result.startswith("{\"cmd\":29"):
-                    print("Got 29 command response")
-                    try:
-                        cmd_res = json.loads(result)
-                        if cmd_res.get("cmd") == 29:
-                            asyncio.create_task(self.handle_registration_event(device_id, cmd_res))
-                    except Exception as e:
-                        print(f"❌ Failed to parse Cmd 29 JSON: {e}")
+                await self.process_event(event)
 
         except Exception as e:
             print("❌ WS parse error:", e)
@@ -1,17 +1,24 @@
 # tasks.py
 import asyncio
+import time
 from datetime import datetime, timedelta
+import config
+import database
 from traccar_client import TraccarClient
 from utils import get_balance_ussd
 
+SIMCARD_NO_COMMAND = "qssd:*733*2#"
+GETPARAM_COMMAND = "getparam 17703;17603;7036;11503;7032;7033;21605;17607;7035;21604;11604;11104;11205;21610;18300;18301;18302;18303;18304;18305;18306;18307;18308;13809"
+
 # -----------------------------------------------------------
 # Per-device action: send balance-check USSD (respects 6h recency)
 # -----------------------------------------------------------
-async def sim_balance_qssd_for_device(api_client: TraccarClient, dev: dict) -> bool:
-    """Send the balance-check USSD (qssd:<ussd>) for a single device.
+def sim_balance_qssd_command(dev: dict):
+    """Pick the balance-check command for a single device, or None to skip.
 
-    Skips if the balance was checked within the last 6 hours. If no IMSI is on
-    file, requests it via getimsi instead. Returns True if a balance USSD was sent.
+    Skips if the balance was checked within the last 6 hours. Returns
+    `qssd:<ussd>` when the operator is known, or `getimsi` when no IMSI is on
+    file yet.
     """
     dev_id = dev["id"]
     attrs = dev.get("attributes", {})
@@ -29,67 +36,120 @@ async def sim_balance_qssd_for_device(api_client: TraccarClient, dev: dict) -> b
 
         if last_check and datetime.now() - last_check < timedelta(hours=6):
             print(f"   -> Skipped {dev_id}: balance checked recently at {balance_ts}")
-            return False
+            return None
 
     # Try to get IMSI from attributes or top-level
     imsi = attrs.get("imsi") or dev.get("imsi")
     ussd_code = get_balance_ussd(str(imsi)) if imsi else None
 
     if ussd_code:
-        await api_client.send_command(dev_id, f"qssd:{ussd_code}")
-        print(f"   -> Sent qssd:{ussd_code} to {dev_id}")
-        return True
+        return f"qssd:{ussd_code}"
 
     if not imsi:
         print(f"   -> No IMSI for {dev_id}, requesting IMSI...")
-        await api_client.send_command(dev_id, "getimsi")
-    else:
-        print(f"   -> Skipped {dev_id}: No USSD code found for IMSI '{imsi}'")
-    return False
+        return "getimsi"
 
+    print(f"   -> Skipped {dev_id}: No USSD code found for IMSI '{imsi}'")
+    return None
 
-# -----------------------------------------------------------
-# Periodic Task: Send qssd every 6 hours
-# -----------------------------------------------------------
-async def periodic_sim_balance_qssd_task(api_client: TraccarClient):
-    while True:
-        try:
-            print("\n⏰ Executing periodic QSSD command task...")
-            # Re-fetch devices to get fresh status
-            devices = await api_client.get_devices()
 
-            t950_devices = [
-                d for d in devices
-                if (d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950")
-            ]
+async def sim_balance_qssd_for_device(api_client: TraccarClient, dev: dict) -> bool:
+    """Send the balance-check USSD (qssd:<ussd>) for a single device.
 
-            count = 0
-            for dev in t950_devices:
-                if dev.get("status") == "online":
-                    try:
-                        if await sim_balance_qssd_for_device(api_client, dev):
-                            count += 1
-                    except Exception as e:
-                        print(f"   -> Failed to send to {dev['id']}: {e}")
+    See `sim_balance_qssd_command` for the skip rules. Returns True if a
+    balance USSD was sent.
+    """
+    cmd = sim_balance_qssd_command(dev)
+    if not cmd:
+        return False
+    await api_client.send_command(dev["id"], cmd)
+    print(f"   -> Sent {cmd} to {dev['id']}")
+    return cmd.startswith("qssd:")
 
-            print(f"✅ Periodic task: Sent to {count} online devices.")
 
-        except Exception as e:
-            print(f"❌ Periodic task top-level error: {e}")
+# -----------------------------------------------------------
+# Bulk send helper for the periodic sweeps
+# -----------------------------------------------------------
+async def send_sweep(api_client: TraccarClient, commands: list, label: str, window: float = None,
+                     job: "PeriodicJob" = None) -> list:
+    """Send `(device_id, command)` pairs via the bounded bulk API and log the outcome.
+
+    The sends are spread over `window` seconds (default
+    `config.COMMAND_SWEEP_WINDOW`) with per-device jitter, so a fleet-wide
+    sweep is a steady trickle rather than a spike on Traccar, the gateway and
+    the USSD callback. Progress is printed every 10%. With a `job`, devices it
+    already reached in this sweep are skipped and each successful send is
+    recorded, so an interrupted sweep can resume. Devices are re-checked
+    right before their send: one that went offline since the snapshot, or
+    that a catch-up already reached, is skipped. Returns the per-device
+    results from `TraccarClient.send_commands`.
+    """
+    window = config.COMMAND_SWEEP_WINDOW if window is None else window
+    if job is not None:
+        pending = [(d, c) for d, c in commands if not job.already_sent(d)]
+        if len(pending) < len(commands):
+            print(f"   -> {label}: {len(commands) - len(pending)} devices already done in this sweep")
+        commands = pending
+    if commands and window > 0:
+        print(f"📤 {label}: spreading {len(commands)} commands over {window / 60:g} min")
+
+    failed = skipped = 0
+    next_report = 0.1
+
+    def skip(device_id, command):
+        if api_client.registry.status(device_id) != "online":
+            return True
+        return job is not None and job.already_sent(device_id)
+
+    def progress(done, total, result):
+        nonlocal failed, skipped, next_report
+        if result["skipped"]:
+            skipped += 1
+        elif not result["ok"]:
+            failed += 1
+        elif job is not None:
+            job.mark_sent(result["device_id"])
+        if done / total >= next_report or done == total:
+            print(f"📤 {label}: {done}/{total} done ({done * 100 // total}%), {failed} failed, {skipped} skipped")
+            next_report = (done * 10 // total + 1) / 10
+
+    results = await api_client.send_commands(
+        commands,
+        window=window,
+        on_progress=progress,
+        skip=skip,
+    )
+    for r in results:
+        if r["skipped"]:
+            continue
+        if r["ok"]:
+            print(f"   -> Sent {r['command']} to {r['device_id']} ({r['elapsed'] * 1000:.0f} ms)")
+        else:
+            print(f"   -> Failed to send {label} to {r['device_id']}: {r['error']}")
+    return results
 
-        # Wait 6 hours
-        await asyncio.sleep(6 * 3600)
+
+# -----------------------------------------------------------
+# Periodic Job: Send qssd every 6 hours
+# -----------------------------------------------------------
+async def sim_balance_qssd_job(api_client: TraccarClient, fleet: "FleetSnapshot", job: "PeriodicJob" = None):
+    print("\n⏰ Executing periodic QSSD command task...")
+    commands = []
+    for dev in fleet.select(model="T950", status="online"):
+        cmd = sim_balance_qssd_command(dev)
+        if cmd:
+            commands.append((dev["id"], cmd))
+
+    results = await send_sweep(api_client, commands, "qssd", job=job)
+    count = sum(1 for r in results if r["ok"] and r["command"].startswith("qssd:"))
+    print(f"✅ Periodic task: Sent to {count} online devices.")
 
 
 # -----------------------------------------------------------
 # Per-device action: request SIMCARD No via USSD when it's missing
 # -----------------------------------------------------------
-async def simcard_no_check_for_device(api_client: TraccarClient, dev: dict) -> bool:
-    """Send the SIMCARD No USSD (qssd:*733*2#) for a single device if it's missing.
-
-    Returns True if the USSD was sent, False if SIMCARD No is already on file.
-    """
-    dev_id = dev["id"]
+def simcard_no_missing(dev: dict) -> bool:
+    """True if the device has no SIMCARD No on file under any of its known keys."""
     attrs = dev.get("attributes", {})
     simcard_no = (
         attrs.get("SIMCARD No")
@@ -97,150 +157,279 @@ async def simcard_no_check_for_device(api_client: TraccarClient, dev: dict) -> b
         or attrs.get("simcardNo")
         or attrs.get("simcard")
     )
-
     if simcard_no:
-        print(f"   -> Skipped {dev_id}: SIMCARD No is present")
+        print(f"   -> Skipped {dev['id']}: SIMCARD No is present")
         return False
-
-    await api_client.send_command(dev_id, "qssd:*733*2#")
-    print(f"   -> Sent qssd:*733*2# to {dev_id} (SIMCARD No missing)")
     return True
 
 
-# -----------------------------------------------------------
-# Periodic Task: Send SIMCARD NO USSD when SIMCARD No is missing
-# -----------------------------------------------------------
-async def periodic_simcard_no_task(api_client: TraccarClient):
-    await asyncio.sleep(6 * 3600)
-    while True:
-        try:
-            print("\n⏰ Executing periodic SIMCARD No check task...")
-            devices = await api_client.get_devices()
-
-            t950_devices = [
-                d for d in devices
-                if (d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950")
-            ]
+async def simcard_no_check_for_device(api_client: TraccarClient, dev: dict) -> bool:
+    """Send the SIMCARD No USSD (qssd:*733*2#) for a single device if it's missing.
 
-            count = 0
-            for dev in t950_devices:
-                if dev.get("status") == "online":
-                    try:
-                        if await simcard_no_check_for_device(api_client, dev):
-                            count += 1
-                    except Exception as e:
-                        print(f"   -> Failed SIMCARD No check for {dev['id']}: {e}")
+    Returns True if the USSD was sent, False if SIMCARD No is already on file.
+    """
+    if not simcard_no_missing(dev):
+        return False
 
-            print(f"✅ Periodic SIMCARD No task: Sent to {count} online devices.")
-        except Exception as e:
-            print(f"❌ Periodic SIMCARD No task top-level error: {e}")
+    dev_id = dev["id"]
+    await api_client.send_command(dev_id, SIMCARD_NO_COMMAND)
+    print(f"   -> Sent {SIMCARD_NO_COMMAND} to {dev_id} (SIMCARD No missing)")
+    return True
 
-        await asyncio.sleep(6 * 3600)
 
+# -----------------------------------------------------------
+# Periodic Job: Send SIMCARD NO USSD when SIMCARD No is missing
+# -----------------------------------------------------------
+async def simcard_no_job(api_client: TraccarClient, fleet: "FleetSnapshot", job: "PeriodicJob" = None):
+    print("\n⏰ Executing periodic SIMCARD No check task...")
+    commands = [(d["id"], SIMCARD_NO_COMMAND)
+                for d in fleet.select(model="T950", status="online") if simcard_no_missing(d)]
+    results = await send_sweep(api_client, commands, "SIMCARD No check", job=job)
+    count = sum(1 for r in results if r["ok"])
+    print(f"✅ Periodic SIMCARD No task: Sent to {count} online devices.")
 
 
 # -----------------------------------------------------------
-# Periodic Task: getparams every 6 hours
+# Periodic Job: getparams every 6 hours
 # -----------------------------------------------------------
-async def periodic_getparams_task(api_client: TraccarClient):
-    while True:
-        try:
-            print("\n⏰ Executing periodic get params task...")
-            # Re-fetch devices to get fresh status
-            devices = await api_client.get_devices()
+async def getparams_job(api_client: TraccarClient, fleet: "FleetSnapshot", job: "PeriodicJob" = None):
+    print("\n⏰ Executing periodic get params task...")
+    commands = [(d["id"], GETPARAM_COMMAND) for d in fleet.select(model="T950", status="online")]
+    results = await send_sweep(api_client, commands, "getparam", job=job)
+    count = sum(1 for r in results if r["ok"])
+    print(f"✅ Periodic task: Sent to {count} online devices.")
 
-            t950_devices = [
-                d for d in devices
-                if (d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950")
-            ]
 
-            count = 0
-            for dev in t950_devices:
-                if dev.get("status") == "online":
-                    dev_id = dev["id"]
-                    try:
-                        await api_client.send_command(dev_id, "getparam 17703;17603;7036;11503;7032;7033;21605;17607;7035;21604;11604;11104;11205;21610;18300;18301;18302;18303;18304;18305;18306;18307;18308;13809")
-                        print(f"   -> Sent getparam to {dev_id}")
-                        count += 1
-                    except Exception as e:
-                        print(f"   -> Failed to send to {dev_id}: {e}")
-            
-            print(f"✅ Periodic task: Sent to {count} online devices.")
+# -----------------------------------------------------------
+# Periodic Job: getimsi every 24 hours (first run after 24h)
+# checking if simcard changed?
+# -----------------------------------------------------------
+async def getimsi_job(api_client: TraccarClient, fleet: "FleetSnapshot", job: "PeriodicJob" = None):
+    print("\n⏰ Executing periodic getimsi task...")
+    commands = [(d["id"], "getimsi") for d in fleet.select(model="T950", status="online")]
+    results = await send_sweep(api_client, commands, "getimsi", job=job)
+    count = sum(1 for r in results if r["ok"])
+    print(f"✅ Periodic getimsi task: Sent to {count} online devices.")
 
-        except Exception as e:
-            print(f"❌ Periodic task top-level error: {e}")
 
-        # Wait 6 hours
-        await asyncio.sleep(6 * 3600)
+# -----------------------------------------------------------
+# Periodic Job: getpass every week
+# -----------------------------------------------------------
+async def getpass_job(api_client: TraccarClient, fleet: "FleetSnapshot", job: "PeriodicJob" = None):
+    print("\n⏰ Executing periodic getpass task...")
+    commands = [(d["id"], "getpass") for d in fleet.select(model="T950", status="online")]
+    results = await send_sweep(api_client, commands, "getpass", job=job)
+    count = sum(1 for r in results if r["ok"])
+    print(f"✅ Periodic getpass task: Sent to {count} online devices.")
 
 
 # -----------------------------------------------------------
-# Periodic Task: getimsi every 24 hours (first run after 24h)
-# checking if simcard changed?
+# Shared fleet snapshot + scheduler for the periodic jobs
 # -----------------------------------------------------------
-async def periodic_getimsi_task(api_client: TraccarClient):
-    print("\n🕒 periodic_getimsi_task scheduled. First run in 24 hours.")
-    await asyncio.sleep(24 * 3600)
-
-    while True:
-        try:
-            print("\n⏰ Executing periodic getimsi task...")
-            devices = await api_client.get_devices()
+class FleetSnapshot:
+    """One view of the fleet, indexed by (model, status), shared by due jobs.
 
-            t950_devices = [
-                d for d in devices
-                if (d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950")
-            ]
+    A device is indexed under its top-level model and its `attributes.model`
+    (as `TraccarClient.find_devices` matches either), and under None for
+    "any model" / "any status".
+    """
 
-            count = 0
-            for dev in t950_devices:
-                if dev.get("status") == "online":
-                    dev_id = dev["id"]
-                    try:
-                        await api_client.send_command(dev_id, "getimsi")
-                        print(f"   -> Sent getimsi to {dev_id}")
-                        count += 1
-                    except Exception as e:
-                        print(f"   -> Failed to send getimsi to {dev_id}: {e}")
+    def __init__(self, devices: list):
+        self.devices = devices
+        self.taken_at = time.time()
+        self._index: dict = {}
+        for dev in devices:
+            models = {None, dev.get("model"), dev.get("attributes", {}).get("model")}
+            for model in models:
+                for status in (None, dev.get("status")):
+                    self._index.setdefault((model, status), []).append(dev)
 
-            print(f"✅ Periodic getimsi task: Sent to {count} online devices.")
+    def select(self, model: str = None, status: str = None) -> list:
+        return self._index.get((model, status), [])
 
-        except Exception as e:
-            print(f"❌ Periodic getimsi task top-level error: {e}")
 
-        await asyncio.sleep(24 * 3600)
+class PeriodicJob:
+    """A periodic sweep and its persisted progress.
 
+    `last_run` is when the last completed sweep started; `sweep_started` is
+    when the current (or interrupted) sweep started. Devices are marked as
+    sent as the sweep goes, so a sweep cut short by a restart resumes with
+    only the devices it had not reached yet.
+    """
 
-# -----------------------------------------------------------
-# Periodic Task: getpass every week
-# -----------------------------------------------------------
-async def periodic_getpass_task(api_client: TraccarClient):
-    print("\n🕒 periodic_getpass_task scheduled. First run in 7 days.")
-    await asyncio.sleep(7 * 24 * 3600)
+    def __init__(self, name: str, run, interval: float, first_delay: float = 0,
+                 command=None, model: str = "T950"):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.first_delay = first_delay
+        # `command(dev)` -> the command this job sends to one device (or None);
+        # used to catch up single devices, see `catch_up_device`.
+        self.command = command
+        self.model = model
+        self.next_due = None
+        self.last_run = None
+        self.sweep_started = None
+        self._sent: set = set()
+
+    @property
+    def interrupted(self) -> bool:
+        return self.sweep_started is not None and (self.last_run is None or self.sweep_started > self.last_run)
+
+    def load(self):
+        self.last_run, self.sweep_started = database.load_job_state(self.name)
+        if self.interrupted:
+            self._sent = database.load_job_sent(self.name, self.sweep_started)
+
+    def discard_sweep(self):
+        """Drop an interrupted sweep so the next `begin` starts a fresh one."""
+        self.sweep_started = self.last_run
+        self._sent = set()
+
+    def begin(self, now: float):
+        if not self.interrupted:
+            self.sweep_started = now
+            self._sent = set()
+            database.save_job_state(self.name, self.last_run, self.sweep_started)
+
+    @property
+    def sent_count(self) -> int:
+        return len(self._sent)
+
+    def already_sent(self, device_id: int) -> bool:
+        return device_id in self._sent
+
+    def mark_sent(self, device_id: int):
+        self._sent.add(device_id)
+        database.mark_job_sent(self.name, device_id, time.time())
+
+    def finish(self):
+        self.last_run = self.sweep_started
+        self._sent = set()
+        database.save_job_state(self.name, self.last_run, self.sweep_started)
+
+
+def default_jobs() -> list:
+    """The periodic sweeps, with the intervals and first-run delays they always had."""
+    return [
+        PeriodicJob("qssd", sim_balance_qssd_job, 6 * 3600,
+                    command=sim_balance_qssd_command),
+        PeriodicJob("simcard_no", simcard_no_job, 6 * 3600, first_delay=6 * 3600,
+                    command=lambda d: SIMCARD_NO_COMMAND if simcard_no_missing(d) else None),
+        PeriodicJob("getparams", getparams_job, 6 * 3600,
+                    command=lambda d: GETPARAM_COMMAND),
+        PeriodicJob("getimsi", getimsi_job, 24 * 3600, first_delay=24 * 3600,
+                    command=lambda d: "getimsi"),
+        PeriodicJob("getpass", getpass_job, 7 * 24 * 3600, first_delay=7 * 24 * 3600,
+                    command=lambda d: "getpass"),
+    ]
+
+
+async def catch_up_device(api_client: TraccarClient, dev: dict, jobs: list) -> list:
+    """Send a device that just came online whatever periodic commands it is overdue for.
+
+    A job is overdue for the device when it has completed at least one sweep
+    and last reached this device more than `interval` seconds ago (or never).
+    This covers devices that were offline when the sweep ran, so the sweeps
+    themselves can run less often. The commands go out one at a time under
+    the client's shared command limits, and one is dropped at send time if
+    its job's running sweep has reached the device meanwhile. Returns the
+    `send_commands` results.
+    """
+    dev_id = dev["id"]
+    if not any(job.last_run is not None and job.command for job in jobs):
+        return []
+    last_sent = database.load_device_last_sent(dev_id)
+    now = time.time()
+
+    commands, senders = [], []
+    for job in jobs:
+        if job.last_run is None or job.command is None:
+            continue
+        if job.model and job.model not in (dev.get("model"), dev.get("attributes", {}).get("model")):
+            continue
+        sent_at = last_sent.get(job.name)
+        if sent_at is not None and now - sent_at < job.interval:
+            continue
+        cmd = job.command(dev)
+        if cmd:
+            commands.append((dev_id, cmd))
+            senders.append(job)
+
+    if not commands:
+        return []
+    print(f"🔁 Device {dev_id} back online, catching up: {[c for _, c in commands]}")
+
+    # One after another: they queue behind each other for this device anyway,
+    # so sending them together would only tie up shared send slots. Each is
+    # checked against (and marked in) its own job, as two jobs can pick the
+    # same command (e.g. qssd falls back to getimsi).
+    results = []
+    for command, job in zip(commands, senders):
+        r = (await api_client.send_commands(
+            [command], skip=lambda device_id, cmd: job.already_sent(device_id)))[0]
+        if r["ok"]:
+            job.mark_sent(dev_id)
+        elif not r["skipped"]:
+            print(f"   -> Failed to send {job.name} to {dev_id}: {r['error']}")
+        results.append(r)
+    return results
+
+
+async def _run_job(api_client: TraccarClient, fleet: FleetSnapshot, job: PeriodicJob):
+    job.begin(time.time())
+    try:
+        await job.run(api_client, fleet, job)
+    except Exception as e:
+        print(f"❌ Periodic {job.name} task top-level error: {e}")
+    job.finish()
+    job.next_due = job.last_run + job.interval
+
+
+async def periodic_jobs_task(api_client: TraccarClient, jobs: list = None):
+    """Run every periodic job when it is due, all from one fleet snapshot per tick.
+
+    The snapshot is taken once per tick (the registry is kept current from
+    the WS stream) and only when at least one job is due. Due jobs run side
+    by side, so each sweep's window starts from the fresh snapshot; their
+    sends share the client's command limits.
+    """
+    jobs = jobs if jobs is not None else default_jobs()
+    start = time.time()
+    for job in jobs:
+        # Resume from the persisted state: an interrupted sweep continues
+        # right away, otherwise the job keeps its cadence across restarts.
+        job.load()
+        if job.interrupted and start - job.sweep_started >= job.interval:
+            # Down for longer than the interval: the devices this sweep reached
+            # are due again, so finishing it would only be followed by a full
+            # new sweep right away. Start that fresh sweep now instead.
+            print(f"\n🕒 {job.name}: interrupted sweep is older than its interval, starting a fresh one.")
+            job.discard_sweep()
+            job.next_due = start
+        elif job.interrupted:
+            job.next_due = start
+            print(f"\n🕒 {job.name}: resuming interrupted sweep ({job.sent_count} devices already sent).")
+        elif job.last_run is not None:
+            job.next_due = job.last_run + job.interval
+        else:
+            job.next_due = start + job.first_delay
+        if job.next_due > start:
+            print(f"\n🕒 {job.name} scheduled. Next run in {(job.next_due - start) / 3600:.1f} hours.")
 
     while True:
-        try:
-            print("\n⏰ Executing periodic getpass task...")
-            devices = await api_client.get_devices()
-
-            t950_devices = [
-                d for d in devices
-                if (d.get("model") == "T950" or d.get("attributes", {}).get("model") == "T950")
-            ]
-
-            count = 0
-            for dev in t950_devices:
-                if dev.get("status") == "online":
-                    dev_id = dev["id"]
-                    try:
-                        await api_client.send_command(dev_id, "getpass")
-                        print(f"   -> Sent getpass to {dev_id}")
-                        count += 1
-                    except Exception as e:
-                        print(f"   -> Failed to send getpass to {dev_id}: {e}")
-
-            print(f"✅ Periodic getpass task: Sent to {count} online devices.")
-        except Exception as e:
-            print(f"❌ Periodic getpass task top-level error: {e}")
-
-        await asyncio.sleep(7 * 24 * 3600)
+        now = time.time()
+        due = [job for job in jobs if job.next_due <= now]
+        if due:
+            try:
+                fleet = FleetSnapshot(await api_client.find_devices())
+            except Exception as e:
+                print(f"❌ Fleet snapshot failed: {e}")
+                fleet = None
+            if fleet is not None:
+                await asyncio.gather(*(_run_job(api_client, fleet, job) for job in due))
+            else:
+                for job in due:
+                    job.next_due = now + job.interval
+
+        await asyncio.sleep(max(1.0, min(job.next_due for job in jobs) - time.time()))
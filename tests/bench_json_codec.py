@@ -0,0 +1,96 @@
+"""Compare stdlib json against orjson on realistic Traccar payloads.
+
+Run: python tests/bench_json_codec.py [device_count]
+"""
+import json
+import random
+import sys
+import os
+import timeit
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json_codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def make_device(i: int) -> dict:
+    """A T950 device shaped like a `devices?all=true` entry, with the big param blobs."""
+    params = ";".join(f"{k}:{random.randint(0, 65535)}" for k in range(1000, 1400)) + ";"
+    tracker = ";".join(f"{k}:{random.randint(0, 9)}" for k in range(17600, 17720)) + ";"
+    return {
+        "id": i,
+        "name": f"خودرو {i}",
+        "uniqueId": f"86486605{i:07d}",
+        "status": random.choice(["online", "offline", "unknown"]),
+        "disabled": False,
+        "lastUpdate": "2024-05-01T10:20:30.000+00:00",
+        "positionId": 1000000 + i,
+        "groupId": 0,
+        "phone": None,
+        "model": "T950",
+        "contact": None,
+        "category": "car",
+        "attributes": {
+            "imsi": f"43235{i:010d}",
+            "firmware": "2.1.0d",
+            "balance": str(random.randint(0, 500000)),
+            "balance_ts": "2024-05-01 10:20:30",
+            "baallparams": params,
+            "trackerparams": tracker,
+        },
+    }
+
+
+def make_ws_frame(n: int) -> dict:
+    return {"positions": [
+        {"id": 5000000 + i, "deviceId": i, "latitude": 35.7 + i / 1e4, "longitude": 51.4,
+         "speed": 12.5, "course": 90, "fixTime": "2024-05-01T10:20:30.000+00:00",
+         "attributes": {"ignition": True, "motion": True, "sat": 9, "power": 12.6}}
+        for i in range(n)
+    ]}
+
+
+def bench(label, fn, number):
+    t = timeit.timeit(fn, number=number) / number
+    print(f"  {label:<28} {t * 1000:8.2f} ms")
+    return t
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    devices = [make_device(i) for i in range(count)]
+    body = json.dumps(devices).encode("utf-8")
+    frame = json.dumps(make_ws_frame(200))
+    number = 5
+
+    print(f"Active codec: {json_codec.NAME}")
+    print(f"Device list: {count} devices, {len(body) / 1e6:.1f} MB")
+    std = bench("json.loads(bytes)", lambda: json.loads(body), number)
+    if orjson:
+        fast = bench("orjson.loads(bytes)", lambda: orjson.loads(body), number)
+        print(f"  speedup: {std / fast:.1f}x")
+
+    print(f"WS positions frame: {len(frame) / 1e3:.0f} KB")
+    std = bench("json.loads(str)", lambda: json.loads(frame), number * 20)
+    if orjson:
+        fast = bench("orjson.loads(str)", lambda: orjson.loads(frame), number * 20)
+        print(f"  speedup: {std / fast:.1f}x")
+
+    payload = devices[0]
+    print("PUT payload encode (1 device):")
+    std = bench("json.dumps().encode()", lambda: json_codec._std_dumps(payload), number * 200)
+    if orjson:
+        fast = bench("orjson.dumps()", lambda: orjson.dumps(payload), number * 200)
+        print(f"  speedup: {std / fast:.1f}x")
+    else:
+        print("\n(orjson not installed: pip install orjson to compare)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from attribute_coalescer import AttributeCoalescer
+
+
+async def _run():
+    writes = []
+
+    async def write(device_id, attrs):
+        writes.append((device_id, dict(attrs)))
+        return True
+
+    coalescer = AttributeCoalescer(write, window=0.01)
+    results = await asyncio.gather(
+        coalescer.update(1, {"balance": "100"}),
+        coalescer.update(1, {"balance_ts": "2024-01-01 00:00:00"}),
+        coalescer.update(1, {"balance": "200"}),
+        coalescer.update(2, {"imsi": "432350000000000"}),
+    )
+
+    assert results == [True, True, True, True]
+    assert sorted(writes) == [
+        (1, {"balance": "200", "balance_ts": "2024-01-01 00:00:00"}),
+        (2, {"imsi": "432350000000000"}),
+    ]
+    assert coalescer.stats() == {"requests": 4, "writes": 2, "pending": 0}
+
+    # Busy from the first buffered update until its write is done
+    coalescer = AttributeCoalescer(write, window=0.01)
+    update = asyncio.ensure_future(coalescer.update(3, {"balance": "5"}))
+    await asyncio.sleep(0)
+    assert coalescer.busy(3) and not coalescer.busy(4)
+    await update
+    assert not coalescer.busy(3)
+
+    async def failing_write(device_id, attrs):
+        raise RuntimeError("PUT 500")
+
+    coalescer = AttributeCoalescer(failing_write, window=0.01)
+    results = await asyncio.gather(
+        coalescer.update(1, {"a": 1}),
+        coalescer.update(1, {"b": 2}),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_coalescer():
+    asyncio.run(_run())
+    print("✅ Attribute coalescer OK")
+
+
+if __name__ == "__main__":
+    test_coalescer()
@@ -0,0 +1,53 @@
+import sys
+import os
+import asyncio
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from command_dispatch import CommandDispatcher
+
+
+def test_dispatch_routes_and_metrics():
+    async def run():
+        calls = []
+
+        async def save(device_id, value):
+            calls.append((device_id, value))
+
+        async def broken(device_id, value):
+            raise RuntimeError("boom")
+
+        d = CommandDispatcher()
+        d.register("PARAM", lambda dev, r: save(dev, "short"))
+        d.register("PARAM SET:", lambda dev, r: save(dev, r[len("PARAM SET:"):]))
+        d.register("IMSI:", lambda dev, r: save(dev, int(r[5:])))
+        d.register("PASS:", lambda dev, r: broken(dev, r))
+
+        # Longest prefix wins
+        await d.route(1, "PARAM SET:1000:5")
+        await d.route(2, "PARAM X")
+        assert calls == [(1, "1000:5"), (2, "short")]
+
+        # Unknown formats and parse errors produce no work
+        assert d.route(1, "HELLO") is None
+        assert d.route(1, "IMSI:abc") is None
+
+        try:
+            await d.route(1, "PASS:1234")
+        except RuntimeError:
+            pass
+
+        stats = d.stats()
+        assert stats["unmatched"] == 1
+        assert stats["PARAM SET"]["count"] == 1
+        assert stats["PARAM SET"]["latency"]["count"] == 1
+        assert stats["IMSI"]["parse_failures"] == 1
+        assert stats["PASS"]["failures"] == 1
+        print("✅ Command dispatch OK")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_dispatch_routes_and_metrics()
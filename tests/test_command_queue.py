@@ -0,0 +1,82 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from command_queue import DeviceCommandQueue
+
+
+def test_pacing_dedup_and_release():
+    async def run():
+        sent = []
+
+        async def send(device_id, command):
+            sent.append((device_id, command, time.monotonic()))
+            return {"id": len(sent)}
+
+        queue = DeviceCommandQueue(send, min_gap=0.05, release_timeout=0.3,
+                                   expects_answer=lambda c: c.startswith("get"))
+        started = time.monotonic()
+
+        async def answer_later():
+            await asyncio.sleep(0.1)
+            queue.settled(1)
+
+        results = await asyncio.gather(
+            queue.submit(1, "getver"),
+            queue.submit(1, "getimsi"),
+            queue.submit(1, "getimsi"),      # duplicate of a queued command
+            queue.submit(2, "getver"),       # other devices don't wait
+            answer_later(),
+        )
+        assert results[1] is results[2]
+        assert [(d, c) for d, c, _ in sent] == [(1, "getver"), (2, "getver"), (1, "getimsi")]
+        # getimsi waited for the getver reply, not for the release timeout
+        assert 0.1 <= sent[2][2] - started < 0.3
+
+        # A repeat of the command still awaiting its reply is dropped
+        assert await queue.submit(1, "getimsi") is results[1]
+
+        # No reply: the next command is released by the timeout
+        await queue.submit(1, "getpass")
+        assert sent[-1][2] - sent[2][2] >= 0.3
+
+        stats = queue.stats()
+        assert stats["deduplicated"] == 2
+        assert stats["released_by_timeout"] == 1
+        await queue.stop()
+        print("✅ Device command queue OK")
+
+    asyncio.run(run())
+
+
+def test_retry_goes_first():
+    async def run():
+        sent = []
+
+        async def send(device_id, command):
+            sent.append(command)
+            return {"id": len(sent)}
+
+        queue = DeviceCommandQueue(send, min_gap=0.0, release_timeout=0.1,
+                                   expects_answer=lambda c: c.startswith("get"))
+        await queue.submit(1, "getver")
+
+        # Unanswered: a plain repeat is dropped, a retry is queued ahead of
+        # commands already waiting for the device
+        assert await queue.submit(1, "getver") == {"id": 1}
+        await asyncio.gather(queue.submit(1, "getimsi"),
+                             queue.submit(1, "getver", retry=True))
+        assert sent == ["getver", "getver", "getimsi"]
+        await queue.stop()
+        print("✅ Device command queue retry OK")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_pacing_dedup_and_release()
+    test_retry_goes_first()
@@ -0,0 +1,72 @@
+import sys
+import os
+import asyncio
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from command_tracker import CommandTracker, command_type
+
+
+def test_command_type():
+    assert command_type("qssd:*140#") == "qssd"
+    assert command_type("bacmd:ALLPARAMS") == "ALLPARAMS"
+    assert command_type("getparam 17703;17603") == "getparam"
+    assert command_type('{"c": 29, "param": {}}') == "cmd 29"
+    assert command_type("getver") == "getver"
+    print("✅ Command types OK")
+
+
+def test_round_trip_and_retries():
+    async def run():
+        resent = []
+
+        async def resend(device_id, command):
+            resent.append((device_id, command))
+
+        online = {1: True, 2: False}
+        tracker = CommandTracker(resend=resend, timeout=10, max_retries=1, backoff=2,
+                                 is_online=lambda d: online.get(d, False))
+
+        tracker.sent(1, "getver", model="T950", now=0)
+        assert tracker.answered(1, "VERSION", now=4) == 4
+        assert tracker.answered(1, "VERSION", now=5) is None   # already answered
+
+        # Online device: one resend, with a longer wait, then a timeout
+        tracker.sent(1, "getimsi", now=0)
+        tracker.expire(now=11)
+        await asyncio.sleep(0)
+        assert resent == [(1, "getimsi")]
+        tracker.expire(now=25)
+        assert tracker.stats()["pending"] == 1
+        tracker.expire(now=32)
+
+        # Offline device: no resend
+        tracker.sent(2, "getpass", now=0)
+        tracker.expire(now=11)
+
+        # Registration (cmd 29) is not safe to repeat: no resend
+        tracker.sent(1, '{"c": 29, "param": {}}', now=40)
+        tracker.expire(now=51)
+        await asyncio.sleep(0)
+        assert len(resent) == 1
+
+        stats = tracker.stats()
+        assert stats["pending"] == 0
+        assert stats["by_type"]["getver"]["latency"]["count"] == 1
+        assert stats["by_model"]["T950"]["count"] == 1
+        assert stats["by_type"]["getimsi"]["retries"] == 1
+        assert stats["by_type"]["getimsi"]["timeouts"] == 1
+        assert stats["by_type"]["getpass"]["retries"] == 0
+        assert stats["by_type"]["cmd 29"]["retries"] == 0
+        assert stats["by_type"]["cmd 29"]["timeouts"] == 1
+        assert sorted(stats["silent_devices"]) == [(1, 2), (2, 1)]
+        await tracker.stop()
+        print("✅ Command tracker OK")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_command_type()
+    test_round_trip_and_retries()
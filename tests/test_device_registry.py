@@ -0,0 +1,51 @@
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from device_registry import DeviceRegistry
+
+
+def test_registry():
+    registry = DeviceRegistry()
+    registry.load([
+        {"id": 1, "uniqueId": "111", "model": "T950", "status": "online", "attributes": {}},
+        {"id": 2, "uniqueId": "222", "status": "offline", "attributes": {"model": "T950"}},
+        {"id": 3, "uniqueId": "333", "model": "T900", "status": "online", "attributes": {}},
+    ])
+
+    assert registry.loaded
+    assert len(registry) == 3
+    assert registry.get_by_unique_id("222")["id"] == 2
+    assert {d["id"] for d in registry.filter(model="T950")} == {1, 2}
+    assert [d["id"] for d in registry.filter(model="T950", status="online")] == [1]
+
+    # Returned copies must not leak mutations back into the registry
+    dev = registry.get(1)
+    dev["attributes"]["imsi"] = "432350000000000"
+    assert "imsi" not in registry.get(1)["attributes"]
+
+    # WS device frames update status and re-index uniqueId
+    registry.put({"id": 2, "uniqueId": "999", "status": "online"})
+    assert registry.get_by_unique_id("222") is None
+    assert registry.get_by_unique_id("999")["status"] == "online"
+    assert registry.get(2)["attributes"] == {"model": "T950"}
+
+    # A resync replaces the contents: deleted devices drop out, versions
+    # keep counting up so in-flight writes notice the change
+    version = registry.version(1)
+    registry.load([
+        {"id": 1, "uniqueId": "111", "model": "T950", "status": "offline", "attributes": {}},
+        {"id": 2, "uniqueId": "999", "status": "online", "attributes": {"model": "T950"}},
+    ])
+    assert registry.ids() == {1, 2}
+    assert registry.get_by_unique_id("333") is None
+    assert registry.status(1) == "offline"
+    assert registry.version(1) > version
+
+    print("✅ Device registry OK")
+
+
+if __name__ == "__main__":
+    test_registry()
@@ -0,0 +1,146 @@
+import asyncio
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient
+from services import DeviceService
+
+
+def iso(dt):
+    return dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def result_event(event_id, device_id, when, result):
+    return {"id": event_id, "deviceId": device_id, "type": "commandResult",
+            "eventTime": iso(when), "attributes": {"result": result}}
+
+
+class StubClient(TraccarClient):
+    """TraccarClient with the events report and device reads served in memory."""
+
+    def __init__(self, device_ids):
+        super().__init__("http://traccar.test/api", "token")
+        self.devices = [{"id": d, "uniqueId": str(d), "name": f"Device {d}", "attributes": {}}
+                        for d in device_ids]
+        self.registry.load(self.devices)
+        self.report = []          # events the report "has"
+        self.report_calls = []
+        self.failing_batch = None
+        self.loads = 0
+
+    async def get_events_report(self, device_ids, from_time, to_time, types=None):
+        self.report_calls.append((list(device_ids), from_time, to_time, types))
+        if device_ids == self.failing_batch:
+            raise RuntimeError("API returned 500")
+        return [e for e in self.report if e["deviceId"] in device_ids]
+
+    async def load_devices(self):
+        self.loads += 1
+        self.registry.load(self.devices)
+        return len(self.devices)
+
+    async def get_device(self, dev_id, refresh=False):
+        return self.registry.get(dev_id)
+
+
+def make_service(client):
+    service = DeviceService(client, backfill_batch_size=2, backfill_max_gap=3600)
+    handled = []
+
+    async def handle(device_id, result):
+        handled.append((device_id, result))
+
+    service.dispatcher.register("TEST:", handle)
+    return service, handled
+
+
+async def settle(service):
+    await asyncio.gather(*list(service._background))
+    await service.shutdown()
+
+
+async def _first_connect_and_live_dedup():
+    client = StubClient([1, 2])
+    service, handled = make_service(client)
+
+    # First connect before any event: nothing to resync or backfill
+    await service.on_socket_connected()
+    await asyncio.sleep(0)
+    assert client.loads == 0 and client.report_calls == []
+
+    now = datetime.now(timezone.utc)
+    await service.process_event(result_event(11, 1, now, "TEST:a"))
+    await service.process_event(result_event(11, 1, now, "TEST:a"))   # repeated frame
+    await settle(service)
+    assert handled == [(1, "TEST:a")]
+    assert service.last_event_time == datetime.fromisoformat(iso(now).replace("Z", "+00:00"))
+
+
+async def _reconnect_resyncs_then_backfills():
+    client = StubClient([1, 2, 3, 4, 5])
+    service, handled = make_service(client)
+
+    now = datetime.now(timezone.utc)
+    live = result_event(11, 1, now - timedelta(hours=10), "TEST:live")
+    await service.process_event(live)
+
+    # First connect has already happened; this is the reconnect
+    service._socket_connects = 1
+    client.report = [
+        live,                                                            # seen live: deduped
+        result_event(13, 2, now - timedelta(minutes=1), "TEST:late"),
+        result_event(12, 2, now - timedelta(minutes=5), "TEST:early"),
+        result_event(15, 3, now - timedelta(minutes=3), "TEST:failed batch"),
+        result_event(14, 5, now - timedelta(minutes=2), "TEST:last batch"),
+    ]
+    client.failing_batch = [3, 4]
+    await service.on_socket_connected()
+    await settle(service)
+
+    assert client.loads == 1
+    # Batched by `backfill_batch_size`; a failed batch doesn't stop the rest
+    assert [ids for ids, *_ in client.report_calls] == [[1, 2], [3, 4], [5]]
+    assert all(types == ("commandResult",) for *_, types in client.report_calls)
+    # The 10-hour gap is clamped to `backfill_max_gap`
+    _, since, until, _ = client.report_calls[0]
+    assert timedelta(minutes=59) < until - since <= timedelta(hours=1)
+    # In eventTime order per batch, without the event already seen live
+    assert handled == [(1, "TEST:live"), (2, "TEST:early"), (2, "TEST:late"), (5, "TEST:last batch")]
+    assert service.event_dedup.hits == 1
+
+
+async def _first_connect_after_events_backfills_only():
+    # Events restored before the socket first connects: backfill, but the
+    # registry was just loaded at startup, so no resync
+    client = StubClient([1])
+    service, handled = make_service(client)
+    await service.process_event(result_event(11, 1, datetime.now(timezone.utc), "TEST:a"))
+    await service.on_socket_connected()
+    await settle(service)
+    assert client.loads == 0
+    assert [ids for ids, *_ in client.report_calls] == [[1]]
+
+
+def test_first_connect_and_live_dedup():
+    asyncio.run(_first_connect_and_live_dedup())
+    print("✅ First connect and live dedup OK")
+
+
+def test_first_connect_after_events_backfills_only():
+    asyncio.run(_first_connect_after_events_backfills_only())
+    print("✅ First connect backfill OK")
+
+
+def test_reconnect_resyncs_then_backfills():
+    asyncio.run(_reconnect_resyncs_then_backfills())
+    print("✅ Reconnect backfill OK")
+
+
+if __name__ == "__main__":
+    test_first_connect_and_live_dedup()
+    test_first_connect_after_events_backfills_only()
+    test_reconnect_resyncs_then_backfills()
@@ -0,0 +1,44 @@
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from event_dedup import EventDeduplicator
+
+
+def test_dedup_window():
+    dedup = EventDeduplicator(ttl=60, max_entries=1000)
+
+    # Bursts larger than the old 100-entry deque are still caught
+    assert not any(dedup.seen(i, now=1000) for i in range(500))
+    assert all(dedup.seen(i, now=1001) for i in range(500))
+
+    # Ids expire once they leave the time window
+    assert not dedup.seen(1, now=1100)
+
+    stats = dedup.stats()
+    assert stats["hits"] == 500
+    assert stats["expired"] == 500
+    assert stats["size"] == 1
+    print("✅ Dedup window OK")
+
+
+def test_dedup_cap_and_reload():
+    dedup = EventDeduplicator(ttl=3600, max_entries=3)
+    for i in range(5):
+        dedup.seen(i)
+    assert len(dedup) == 3
+    assert dedup.stats()["evicted"] == 2
+    assert dedup.seen(4)
+    assert not dedup.seen(0)
+
+    restored = EventDeduplicator(ttl=3600, max_entries=3)
+    restored.load(dedup.entries())
+    assert restored.seen(4)
+    print("✅ Dedup cap / reload OK")
+
+
+if __name__ == "__main__":
+    test_dedup_window()
+    test_dedup_cap_and_reload()
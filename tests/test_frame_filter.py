@@ -0,0 +1,37 @@
+import json
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient
+from services import DeviceService
+
+
+def test_accept_frame():
+    service = DeviceService(TraccarClient("http://traccar.test/api", "token"))
+
+    positions = json.dumps({"positions": [{"id": 1, "deviceId": 7, "latitude": 35.7}]})
+    events = json.dumps({"events": [{"id": 2, "deviceId": 7, "type": "deviceOnline"}]})
+    devices = json.dumps({"devices": [{"id": 7, "status": "online"}]})
+    mixed = json.dumps({"positions": [], "events": []})
+
+    # Position-only frames are dropped and counted
+    assert not service.accept_frame(positions)
+    assert not service.accept_frame("{}")
+    # Frames with events or devices pass, whatever else they carry
+    assert service.accept_frame(events)
+    assert service.accept_frame(devices)
+    assert service.accept_frame(mixed)
+
+    assert service.frame_stats() == {
+        "seen": 5,
+        "skipped": 2,
+        "skipped_bytes": len(positions) + len("{}"),
+    }
+    print("✅ WS frame prefilter OK")
+
+
+if __name__ == "__main__":
+    test_accept_frame()
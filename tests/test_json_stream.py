@@ -0,0 +1,47 @@
+import json
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from json_codec import JsonArrayStream, loads
+from device_registry import project_device
+
+
+def test_array_stream():
+    devices = [
+        {"id": i, "name": f"خودرو {i}", "status": "online",
+         "attributes": {"baallparams": "1000:1;1001:\"x\";", "odd": "}]\\\\[{", "nested": [{"a": i}]}}
+        for i in range(1, 40)
+    ]
+    body = json.dumps(devices, ensure_ascii=False).encode("utf-8")
+
+    # Any chunking (including splits inside multi-byte chars and escapes) yields the same devices
+    for size in (1, 3, 17, 4096, len(body)):
+        stream = JsonArrayStream()
+        out = []
+        for i in range(0, len(body), size):
+            out.extend(loads(raw) for raw in stream.feed(body[i:i + size]))
+        assert out == devices, size
+        assert stream.closed
+
+    stream = JsonArrayStream()
+    assert stream.feed(b"[]") == []
+    assert stream.closed
+
+    print("✅ JSON array stream OK")
+
+
+def test_project_device():
+    dev = {"id": 7, "name": "x", "status": "online", "model": "T950",
+           "attributes": {"imsi": "1", "baallparams": "1000:1;"}}
+    out = project_device(dev, fields=("status", "model"), attributes=("imsi",))
+    assert out == {"id": 7, "status": "online", "model": "T950", "attributes": {"imsi": "1"}}
+    assert project_device(dev) is dev
+    print("✅ Device projection OK")
+
+
+if __name__ == "__main__":
+    test_array_stream()
+    test_project_device()
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient
+
+
+class FakeContent:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), 7):   # small chunks split the elements
+            yield self.body[i:i + 7]
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.status = 200
+        self.content = FakeContent(body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self):
+        self.body = b"[]"
+
+    def get(self, url, **kwargs):
+        return FakeResponse(self.body)
+
+
+def listing(*devices):
+    return json.dumps([{"id": d, "uniqueId": str(d), "status": "online", "attributes": {}}
+                       for d in devices]).encode()
+
+
+async def _run():
+    session = FakeSession()
+    client = TraccarClient("http://traccar.test/api", "token", session=session)
+
+    session.body = listing(1, 2, 3)
+    assert await client.load_devices() == 3
+    assert client.registry.loaded and client.registry.ids() == {1, 2, 3}
+
+    # A resync drops devices Traccar no longer returns
+    session.body = listing(1, 3)
+    assert await client.load_devices() == 2
+    assert client.registry.ids() == {1, 3}
+    assert client.registry.get_by_unique_id("2") is None
+
+    # A truncated body raises and leaves the registry as it was
+    session.body = listing(1, 3, 4)[:-40]
+    try:
+        await client.load_devices()
+    except RuntimeError as e:
+        assert "truncated" in str(e)
+    else:
+        raise AssertionError("expected a truncated-listing error")
+    assert client.registry.ids() >= {1, 3}
+
+
+def test_load_devices():
+    asyncio.run(_run())
+    print("✅ Streamed device load OK")
+
+
+if __name__ == "__main__":
+    test_load_devices()
@@ -0,0 +1,128 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient, TraccarHTTPError
+
+
+def device(**attrs):
+    return {"id": 1, "name": "خودرو 1", "uniqueId": "111", "status": "online", "attributes": attrs}
+
+
+class StubClient(TraccarClient):
+    """TraccarClient with the REST calls replaced by an in-memory Traccar."""
+
+    def __init__(self, server_dev):
+        super().__init__("http://traccar.test/api", "token")
+        self.server = server_dev
+        self.puts = []
+        self.gets = 0
+        self.put_errors = []      # raised by the next PUTs, in order
+        self.on_put = None        # runs while a PUT is "in flight"
+
+    async def _call(self, path, params=None):
+        self.gets += 1
+        return dict(self.server, attributes=dict(self.server["attributes"]))
+
+    async def _put_device(self, device_id, payload):
+        self.puts.append(payload)
+        if self.put_errors:
+            raise self.put_errors.pop(0)
+        if self.on_put:
+            hook, self.on_put = self.on_put, None
+            hook()
+        await asyncio.sleep(0)
+        self.server = dict(payload, attributes=dict(payload["attributes"]))
+        self.device_writes += 1
+        return payload
+
+
+def set_attr(key, value):
+    def apply(attrs):
+        attrs[key] = value
+        return attrs
+    return apply
+
+
+async def _rebase_on_version_bump():
+    client = StubClient(device(balance="100"))
+    client.registry.load([client.server])
+
+    # A WS devices frame changes `imsi` while our `balance` PUT is in flight
+    def ws_frame():
+        client.registry.put(device(balance="100", imsi="432350000000000"))
+    client.on_put = ws_frame
+
+    saved = await client.modify_device_attributes(1, set_attr("balance", "200"))
+    assert len(client.puts) == 2
+    assert client.puts[1]["attributes"] == {"balance": "200", "imsi": "432350000000000"}
+    assert saved["attributes"] == {"balance": "200", "imsi": "432350000000000"}
+    assert client.gets == 0
+
+
+async def _fresh_get_after_4xx_on_cached_copy():
+    client = StubClient(device(balance="100", imsi="432350000000000"))
+    client.registry.load([device(balance="100")])    # cached copy is behind
+    client.put_errors = [TraccarHTTPError(400, "PUT 400: stale device")]
+
+    saved = await client.modify_device_attributes(1, set_attr("balance", "200"))
+    assert client.gets == 1
+    assert client.puts[-1]["attributes"] == {"balance": "200", "imsi": "432350000000000"}
+    assert saved["attributes"]["imsi"] == "432350000000000"
+
+    # A 4xx on a fresh copy is not retried again
+    client.put_errors = [TraccarHTTPError(400, "PUT 400"), TraccarHTTPError(400, "PUT 400")]
+    try:
+        await client.modify_device_attributes(1, set_attr("balance", "300"))
+    except TraccarHTTPError as e:
+        assert e.status == 400
+    else:
+        raise AssertionError("expected TraccarHTTPError")
+    assert client.gets == 2
+
+
+async def _5xx_is_raised():
+    client = StubClient(device(balance="100"))
+    client.registry.load([client.server])
+    client.put_errors = [TraccarHTTPError(502, "PUT 502")]
+    try:
+        await client.modify_device_attributes(1, set_attr("balance", "200"))
+    except TraccarHTTPError as e:
+        assert e.status == 502
+    else:
+        raise AssertionError("expected TraccarHTTPError")
+    assert len(client.puts) == 1 and client.gets == 0
+    assert client.registry.get(1)["attributes"] == {"balance": "100"}
+
+
+async def _concurrent_updates_keep_both():
+    client = StubClient(device())
+    client.registry.load([client.server])
+
+    await asyncio.gather(
+        client.modify_device_attributes(1, set_attr("balance", "200")),
+        client.modify_device_attributes(1, set_attr("imsi", "432350000000000")),
+        client.modify_device_attributes(1, set_attr("firmware", "2.1.0d")),
+    )
+    expected = {"balance": "200", "imsi": "432350000000000", "firmware": "2.1.0d"}
+    assert client.server["attributes"] == expected
+    assert client.registry.get(1)["attributes"] == expected
+
+    # Nothing to change: no PUT
+    await client.modify_device_attributes(1, set_attr("balance", "200"))
+    assert len(client.puts) == 3 and client.skipped_writes == 1
+
+
+def test_modify_device_attributes():
+    asyncio.run(_rebase_on_version_bump())
+    asyncio.run(_fresh_get_after_4xx_on_cached_copy())
+    asyncio.run(_5xx_is_raised())
+    asyncio.run(_concurrent_updates_keep_both())
+    print("✅ modify_device_attributes OK")
+
+
+if __name__ == "__main__":
+    test_modify_device_attributes()
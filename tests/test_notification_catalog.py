@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from notification_catalog import NotificationCatalog, make_notif
+
+
+DEFINITIONS = [
+    make_notif("ignitionOn", "web", {}),
+    make_notif("ignitionOn", "firebase", {}),
+    make_notif("alarm", "web", {"alarms": "tow"}),
+    make_notif("alarm", "web", {"alarms": "idle"}),
+]
+
+
+class MockClient:
+    def __init__(self, existing):
+        self.notifications = list(existing)
+        self.created = []
+        self.fail_types = set()
+        self.links = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def get_notifications(self):
+        return [dict(n) for n in self.notifications]
+
+    async def create_notification(self, nd):
+        if nd["type"] in self.fail_types:
+            raise RuntimeError("POST 500")
+        notif = dict(nd, id=100 + len(self.notifications))
+        self.notifications.append(notif)
+        self.created.append(notif["id"])
+        return notif
+
+    async def add_permission_generic(self, path, key1, val1, key2, val2):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.links.append((val1, val2))
+
+
+async def _run():
+    # Existing notifications are matched on type, notificator and alarm;
+    # only the missing ones are created
+    client = MockClient([dict(make_notif("ignitionOn", "web", {}), id=1),
+                         dict(make_notif("alarm", "web", {"alarms": "tow"}), id=2),
+                         dict(make_notif("alarm", "web", {"alarms": "overspeed"}), id=3)])
+    catalog = NotificationCatalog(DEFINITIONS, link_concurrency=2)
+    client.fail_types = {"alarm"}
+    ids = await catalog.ensure_ids(client)
+    assert ids == [1, 103, 2]            # alarm/idle failed
+    assert client.created == [103]
+
+    # A failed definition isn't cached: the next call creates just that one
+    client.fail_types = set()
+    ids = await catalog.ensure_ids(client)
+    assert ids == [1, 103, 2, 104]
+    assert client.created == [103, 104]
+
+    # Complete now: cached, no more lookups or creates
+    client.notifications = []
+    assert await catalog.ensure_ids(client) == [1, 103, 2, 104]
+
+    # Linking a user runs at most `link_concurrency` at a time
+    assert await catalog.link_user(client, 7) == 4
+    assert sorted(client.links) == [(7, 1), (7, 2), (7, 103), (7, 104)]
+    assert client.peak == 2
+
+
+def test_notification_catalog():
+    asyncio.run(_run())
+    print("✅ Notification catalog OK")
+
+
+if __name__ == "__main__":
+    test_notification_catalog()
@@ -0,0 +1,50 @@
+import sys
+import os
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+import database
+from param_store import ParamStore, format_params
+
+
+def test_param_store_diff():
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DB_FILE = os.path.join(tmp, "params.db")
+        database.init_db()
+
+        store = ParamStore()
+        assert not store.has(1, "baallparams")
+        store.seed(1, "baallparams", {100: "1", 101: "2"})
+
+        # Same values: nothing to write
+        assert store.diff(1, "baallparams", {100: "1"}) == {}
+        changed = store.diff(1, "baallparams", {101: "3", 102: "4"})
+        assert changed == {101: "3", 102: "4"}
+        assert format_params(store.applied(1, "baallparams", changed)) == "100:1;101:3;102:4;"
+
+        # Nothing is saved until the diff is committed (i.e. the PUT succeeded)
+        assert store.diff(1, "baallparams", {101: "3", 102: "4"}) == changed
+        store.commit(1, "baallparams", changed)
+        assert format_params(store.get(1, "baallparams")) == "100:1;101:3;102:4;"
+
+        # A full list also reports params that disappeared
+        changed = store.diff(1, "baallparams", {100: "1", 101: "3"}, full=True)
+        assert changed == {102: None}
+        store.commit(1, "baallparams", changed)
+        assert store.diff(1, "baallparams", {100: "1", 101: "3"}, full=True) == {}
+
+        # Values survive a restart
+        reloaded = ParamStore()
+        assert reloaded.has(1, "baallparams")
+        assert reloaded.get(1, "baallparams") == {100: "1", 101: "3"}
+        assert not reloaded.has(1, "trackerparams")
+
+        assert store.stats()["unchanged"] == 2
+        print("✅ Param store OK")
+
+
+if __name__ == "__main__":
+    test_param_store_diff()
@@ -0,0 +1,222 @@
+import sys
+import os
+import asyncio
+import tempfile
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+import database
+from device_registry import DeviceRegistry
+from tasks import FleetSnapshot, PeriodicJob, periodic_jobs_task, catch_up_device, send_sweep
+
+
+class MockClient:
+    def __init__(self, devices):
+        self.devices = devices
+        self.snapshots = 0
+        self.registry = DeviceRegistry()
+        self.registry.load(devices)
+
+    async def find_devices(self, model=None, status=None):
+        self.snapshots += 1
+        return self.devices
+
+    async def send_commands(self, commands, skip=None, on_progress=None, **kwargs):
+        results = []
+        for d, c in commands:
+            skipped = bool(skip and skip(d, c))
+            if not skipped:
+                self.sent = getattr(self, "sent", []) + [(d, c)]
+            results.append({"device_id": d, "command": c, "ok": not skipped, "skipped": skipped,
+                            "result": None, "error": None, "elapsed": 0.0})
+            if on_progress:
+                on_progress(len(results), len(commands), results[-1])
+        return results
+
+
+def test_fleet_snapshot_index():
+    fleet = FleetSnapshot([
+        {"id": 1, "model": "T950", "status": "online"},
+        {"id": 2, "model": "A10", "status": "online", "attributes": {"model": "T950"}},
+        {"id": 3, "model": "T950", "status": "offline"},
+    ])
+    assert [d["id"] for d in fleet.select(model="T950", status="online")] == [1, 2]
+    assert [d["id"] for d in fleet.select(model="T950")] == [1, 2, 3]
+    assert [d["id"] for d in fleet.select(status="offline")] == [3]
+    assert fleet.select(model="X") == []
+    print("✅ Fleet snapshot OK")
+
+
+def use_temp_db(tmp):
+    config.DB_FILE = os.path.join(tmp, "jobs.db")
+    database.init_db()
+
+
+async def run_for(client, jobs, seconds):
+    task = asyncio.create_task(periodic_jobs_task(client, jobs))
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_due_jobs_share_one_snapshot():
+    async def run():
+        client = MockClient([{"id": 1, "model": "T950", "status": "online"}])
+        seen = []
+
+        async def job(api_client, fleet, job):
+            seen.append(id(fleet))
+            await asyncio.sleep(10)   # still sweeping: the other due job doesn't wait for it
+
+        with tempfile.TemporaryDirectory() as tmp:
+            use_temp_db(tmp)
+            jobs = [PeriodicJob("a", job, 3600), PeriodicJob("b", job, 3600),
+                    PeriodicJob("later", job, 3600, first_delay=3600)]
+            await run_for(client, jobs, 0.05)
+
+        assert client.snapshots == 1
+        assert len(seen) == 2 and seen[0] == seen[1]
+        print("✅ Periodic jobs share one snapshot OK")
+
+    asyncio.run(run())
+
+
+def test_job_state_survives_restart():
+    async def run():
+        client = MockClient([])
+        sent = []
+
+        async def sweep(api_client, fleet, job):
+            for device_id in (1, 2, 3):
+                if not job.already_sent(device_id):
+                    sent.append(device_id)
+                    job.mark_sent(device_id)
+                    if device_id == 2 and len(sent) == 2:
+                        await asyncio.sleep(10)   # "restart" mid-sweep
+
+        with tempfile.TemporaryDirectory() as tmp:
+            use_temp_db(tmp)
+            await run_for(client, [PeriodicJob("sweep", sweep, 3600)], 0.05)
+            assert sent == [1, 2]
+
+            # The interrupted sweep resumes with the devices it had not reached
+            job = PeriodicJob("sweep", sweep, 3600)
+            await run_for(client, [job], 0.05)
+            assert sent == [1, 2, 3]
+            assert not job.interrupted
+
+            # A completed sweep is not re-run on the next start
+            await run_for(client, [PeriodicJob("sweep", sweep, 3600)], 0.05)
+            assert sent == [1, 2, 3]
+        print("✅ Periodic job state OK")
+
+    asyncio.run(run())
+
+
+def test_stale_interrupted_sweep_restarts_once():
+    async def run():
+        sent = []
+
+        async def sweep(api_client, fleet, job):
+            for device_id in (1, 2, 3):
+                if not job.already_sent(device_id):
+                    sent.append(device_id)
+                    job.mark_sent(device_id)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            use_temp_db(tmp)
+            # Cut short two intervals ago, after reaching devices 1 and 2
+            started = time.time() - 2 * 3600
+            database.save_job_state("sweep", None, started)
+            database.mark_job_sent("sweep", 1, started + 1)
+            database.mark_job_sent("sweep", 2, started + 2)
+
+            job = PeriodicJob("sweep", sweep, 3600)
+            await run_for(MockClient([]), [job], 0.05)
+            # One fresh sweep to every device, not a resume followed by a re-blast
+            assert sent == [1, 2, 3]
+            assert job.next_due > time.time() + 3000
+        print("✅ Stale interrupted sweep OK")
+
+    asyncio.run(run())
+
+
+def test_catch_up_overdue_commands():
+    async def run():
+        async def noop(api_client, fleet, job):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmp:
+            use_temp_db(tmp)
+            daily = PeriodicJob("daily", noop, 24 * 3600, command=lambda d: "getimsi")
+            weekly = PeriodicJob("weekly", noop, 7 * 24 * 3600, command=lambda d: "getpass")
+            never_ran = PeriodicJob("never", noop, 3600, command=lambda d: "getparam")
+            daily.last_run = weekly.last_run = 1.0
+            dev = {"id": 7, "model": "T950", "attributes": {}}
+
+            # Recently reached by the weekly sweep, missed by the daily one
+            weekly.mark_sent(7)
+            client = MockClient([])
+            await catch_up_device(client, dev, [daily, weekly, never_ran])
+            assert client.sent == [(7, "getimsi")]
+
+            # Nothing is overdue right after catching up
+            client = MockClient([])
+            assert await catch_up_device(client, dev, [daily, weekly, never_ran]) == []
+
+            # A running sweep that reaches the device first wins
+            class SweepFirst(MockClient):
+                async def send_commands(self, commands, **kwargs):
+                    daily.mark_sent(9)
+                    return await super().send_commands(commands, **kwargs)
+
+            client = SweepFirst([])
+            results = await catch_up_device(client, {"id": 9, "model": "T950"}, [daily])
+            assert [r["skipped"] for r in results] == [True]
+            assert not hasattr(client, "sent")
+
+            # Two jobs picking the same command are each marked in their own state
+            qssd = PeriodicJob("qssd", noop, 6 * 3600, command=lambda d: "getimsi")
+            qssd.last_run = 1.0
+            client = MockClient([])
+            dev10 = {"id": 10, "model": "T950"}
+            await catch_up_device(client, dev10, [qssd, daily])
+            assert client.sent == [(10, "getimsi"), (10, "getimsi")]
+            assert qssd.already_sent(10) and daily.already_sent(10)
+            assert await catch_up_device(MockClient([]), dev10, [qssd, daily]) == []
+
+            # Other models are left alone
+            other = {"id": 8, "model": "A10", "attributes": {}}
+            assert await catch_up_device(MockClient([]), other, [daily]) == []
+        print("✅ Online catch-up OK")
+
+    asyncio.run(run())
+
+
+def test_sweep_rechecks_status_at_send_time():
+    async def run():
+        client = MockClient([{"id": 1, "model": "T950", "status": "online"},
+                             {"id": 2, "model": "T950", "status": "online"}])
+        with tempfile.TemporaryDirectory() as tmp:
+            use_temp_db(tmp)
+            job = PeriodicJob("sweep", None, 3600)
+            job.begin(time.time())
+            # Device 2 went offline after the snapshot listed it
+            client.registry.put({"id": 2, "status": "offline"})
+            await send_sweep(client, [(1, "getimsi"), (2, "getimsi")], "getimsi", window=0, job=job)
+            assert client.sent == [(1, "getimsi")]
+            assert job.already_sent(1) and not job.already_sent(2)
+        print("✅ Sweep send-time status check OK")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_fleet_snapshot_index()
+    test_due_jobs_share_one_snapshot()
+    test_job_state_survives_restart()
+    test_stale_interrupted_sweep_restarts_once()
+    test_catch_up_overdue_commands()
+    test_sweep_rechecks_status_at_send_time()
@@ -0,0 +1,48 @@
+import sys
+import os
+import asyncio
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+import database
+from provision_scheduler import ProvisionScheduler
+
+
+def test_scheduler_order_and_resume():
+    async def run():
+        fired = []
+
+        async def run_step(device_id, step):
+            fired.append((device_id, step))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            config.DB_FILE = os.path.join(tmp, "provision.db")
+            database.init_db()
+
+            sched = ProvisionScheduler(run_step)
+            sched.start()
+            sched.schedule(1, "getver", 0.2)
+            sched.schedule(2, "getver", 0.05)
+            sched.schedule(3, "getver", 60)
+            # Rescheduling replaces the earlier due time
+            sched.schedule(2, "getver", 0.1)
+            await asyncio.sleep(0.35)
+            assert fired == [(2, "getver"), (1, "getver")]
+            await sched.stop()
+
+            # The step not yet due survives a restart
+            resumed = ProvisionScheduler(run_step)
+            resumed.start()
+            assert resumed.stats()["pending"] == 1
+            await resumed.stop()
+            assert database.load_provision_jobs()[0][:2] == (3, "getver")
+        print("✅ Provision scheduler OK")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_scheduler_order_and_resume()
@@ -0,0 +1,53 @@
+import asyncio
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient
+from command_tracker import CommandTracker
+
+
+class StubClient(TraccarClient):
+    """TraccarClient whose command POSTs are recorded instead of sent."""
+
+    def __init__(self, **kwargs):
+        super().__init__("http://traccar.test/api", "token", **kwargs)
+        self.tracker = CommandTracker()   # only for `expects_answer`; never started
+        self.posts = []
+
+    async def _post(self, path, payload):
+        self.posts.append((payload["deviceId"], payload["attributes"]["data"], time.monotonic()))
+        await asyncio.sleep(0.01)
+        return {"id": len(self.posts)}
+
+
+async def _silent_device_does_not_stall_others():
+    client = StubClient(command_gap=0.01, command_release_timeout=1.0, command_concurrency=2)
+    started = time.monotonic()
+
+    # Device 1 never answers: its later commands wait out the release timeout
+    silent = asyncio.ensure_future(client.send_commands([(1, "getver"), (1, "getimsi"), (1, "getpass")]))
+    await asyncio.sleep(0)
+    others_done = await client.send_commands([(d, "getver") for d in range(2, 12)])
+    elapsed = time.monotonic() - started
+
+    assert all(r["ok"] for r in others_done)
+    assert elapsed < 0.5, f"other devices waited {elapsed:.2f}s behind the silent one"
+    assert [c for d, c, _ in client.posts if d == 1] == ["getver"]
+
+    # The silent device's commands still go out, one release timeout apart
+    results = await silent
+    assert [r["ok"] for r in results] == [True, True, True]
+    await client.command_queue.stop()
+
+
+def test_silent_device_does_not_stall_others():
+    asyncio.run(_silent_device_does_not_stall_others())
+    print("✅ send_commands with a silent device OK")
+
+
+if __name__ == "__main__":
+    test_silent_device_does_not_stall_others()
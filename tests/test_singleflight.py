@@ -0,0 +1,68 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from traccar_client import TraccarClient
+
+
+class StubClient(TraccarClient):
+    """TraccarClient whose GETs are answered in memory after a short delay."""
+
+    def __init__(self):
+        super().__init__("http://traccar.test/api", "token")
+        self.requests = []
+
+    async def _get_json(self, path, params=None):
+        self.requests.append((path, params))
+        await asyncio.sleep(0.01)
+        if path == "devices/404":
+            raise RuntimeError("API returned 404: not found")
+        return {"id": 1, "attributes": {"imsi": "432350000000000"}}
+
+
+async def _run():
+    client = StubClient()
+
+    # Identical GETs in flight share one request; different params don't
+    results = await asyncio.gather(
+        client._call("devices/1"),
+        client._call("devices/1"),
+        client._call("devices/1"),
+        client._call("devices/1", params={"all": "true"}),
+    )
+    assert len(client.requests) == 2
+    assert client.singleflight_stats() == {"hits": 2, "misses": 2, "in_flight": 0}
+    assert all(r == results[0] for r in results)
+
+    # Every caller gets its own copy, the one that started the request too
+    async def mutate_first():
+        dev = await client._call("devices/1")
+        dev["attributes"]["imsi"] = "MUTATED"
+        return dev
+
+    async def read_second():
+        await asyncio.sleep(0)
+        return await client._call("devices/1")
+
+    first, second = await asyncio.gather(mutate_first(), read_second())
+    assert first is not second
+    assert second["attributes"]["imsi"] == "432350000000000"
+
+    # A failure reaches every waiter, and the next call sends a new request
+    errors = await asyncio.gather(client._call("devices/404"), client._call("devices/404"),
+                                  return_exceptions=True)
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    await client._call("devices/1")
+    assert len(client.requests) == 5
+
+
+def test_singleflight():
+    asyncio.run(_run())
+    print("✅ Single-flight GETs OK")
+
+
+if __name__ == "__main__":
+    test_singleflight()
@@ -0,0 +1,123 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from user_index import UserIndex
+
+
+def test_user_index():
+    index = UserIndex(ttl=3600)
+    assert not index.loaded
+    index.load([
+        {"id": 1, "email": "09120000001", "name": "09120000001", "login": "ali"},
+        {"id": 2, "email": "reza@example.com", "name": "Reza"},
+        {"id": 0, "email": "ignored@example.com"},
+    ])
+    assert index.loaded and len(index) == 2
+    assert index.lookup("09120000001") == 1
+    assert index.lookup("ali") == 1
+    assert index.lookup("reza@example.com") == 2
+    assert index.lookup("Reza") == 2
+    assert index.lookup("ignored@example.com") is None
+
+    # Re-adding a user replaces its old keys
+    index.add({"id": 2, "email": "reza@new.example.com", "name": "Reza"})
+    assert index.lookup("reza@example.com") is None
+    assert index.lookup("reza@new.example.com") == 2
+
+    # Expired (or invalidated) indexes report themselves as not loaded
+    index.ttl = 0
+    assert not index.loaded
+    index.ttl = 3600
+    index.invalidate()
+    assert not index.loaded
+    print("✅ User index OK")
+
+
+def test_find_user_id_by_username():
+    from traccar_client import TraccarClient
+
+    class StubClient(TraccarClient):
+        def __init__(self):
+            super().__init__("http://traccar.test/api", "token", user_index_ttl=3600)
+            self.users_db = [{"id": 1, "email": "09120000001", "name": "09120000001"}]
+            self.calls = []
+
+        async def get_users(self, params=None):
+            self.calls.append(params)
+            if params and "search" in params:
+                return [u for u in self.users_db if params["search"] in (u["email"], u["name"])]
+            return list(self.users_db)
+
+    async def run():
+        client = StubClient()
+        # Built once from the full list, then answered locally
+        assert await client.find_user_id_by_username("09120000001") == 1
+        assert await client.find_user_id_by_username("09120000001") == 1
+        assert client.calls == [None]
+
+        # A user created elsewhere is found with a server-side search on a miss
+        client.users_db.append({"id": 2, "email": "09120000002", "name": "09120000002"})
+        assert await client.find_user_id_by_username("09120000002") == 2
+        assert client.calls == [None, {"search": "09120000002"}]
+        assert await client.find_user_id_by_username("09120000002") == 2
+        assert await client.find_user_id_by_username("nobody") == 0
+        assert len(client.calls) == 3
+
+        # Once the TTL passes, the index is rebuilt from the full list
+        client.users.ttl = 0
+        await client.find_user_id_by_username("09120000001")
+        assert client.calls[-1] is None
+
+    asyncio.run(run())
+    print("✅ User lookup through the index OK")
+
+
+def test_created_user_is_indexed():
+    import api.auth as auth
+
+    class FakeClient:
+        def __init__(self, base_url, token=None):
+            pass
+
+        async def get_users(self, params=None):
+            return []
+
+        async def add_user(self, payload):
+            return {"id": 9, "email": payload["email"], "name": payload["name"]}
+
+        async def login(self, user, password):
+            pass
+
+        async def request_token(self, expiration):
+            return "token-9"
+
+        async def close(self):
+            pass
+
+    class FakeCatalog:
+        async def link_user(self, client, user_id):
+            return 0
+
+    async def run():
+        index = UserIndex()
+        index.load([])
+        real_client, real_catalog = auth.TraccarClient, auth.notification_catalog
+        auth.TraccarClient, auth.notification_catalog = FakeClient, FakeCatalog()
+        try:
+            assert await auth.create_user_and_get_token("09120000009", user_index=index) == "token-9"
+        finally:
+            auth.TraccarClient, auth.notification_catalog = real_client, real_catalog
+        assert index.lookup("09120000009") == 9
+
+    asyncio.run(run())
+    print("✅ New user added to the index OK")
+
+
+if __name__ == "__main__":
+    test_user_index()
+    test_find_user_id_by_username()
+    test_created_user_is_indexed()
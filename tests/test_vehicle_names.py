@@ -0,0 +1,32 @@
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vehicle_names import VehicleNumberIndex, vehicle_number
+
+
+def test_vehicle_number_index():
+    assert vehicle_number("خودرو 12") == 12
+    assert vehicle_number("خودرو abc") is None
+    assert vehicle_number("Other Device") is None
+
+    index = VehicleNumberIndex()
+    # Frames for users that were never listed are ignored
+    index.observe(10, "خودرو 7")
+    assert not index.loaded(10)
+
+    index.load(10, [{"name": "خودرو 1"}, {"name": "خودرو 3"}, {"name": "Other Device"}])
+    assert index.next_name(10) == "خودرو 4"
+    index.observe(10, "خودرو 4")
+    index.observe(10, "خودرو 2")
+    assert index.next_name(10) == "خودرو 5"
+
+    index.load(11, [])
+    assert index.next_name(11) == "خودرو 1"
+    print("✅ Vehicle number index OK")
+
+
+if __name__ == "__main__":
+    test_vehicle_number_index()
@@ -0,0 +1,83 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from work_queue import WorkQueue, KeyedLanes
+
+
+async def _run():
+    handled = []
+    running = 0
+    peak = 0
+
+    async def handler(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.001)
+            if item == 3:
+                raise ValueError("bad frame")
+            handled.append(item)
+        finally:
+            running -= 1
+
+    queue = WorkQueue(handler, workers=2, maxsize=2, name="test")
+    queue.start()
+    for i in range(10):
+        await queue.put(i)
+    await queue.stop()
+
+    stats = queue.stats()
+    assert sorted(handled) == [i for i in range(10) if i != 3]
+    assert peak <= 2
+    assert stats["enqueued"] == 10
+    assert stats["processed"] == 9
+    assert stats["errors"] == 1
+    assert stats["max_depth"] <= 2
+    assert stats["overflows"] > 0
+
+
+def test_work_queue():
+    asyncio.run(_run())
+    print("✅ Work queue OK")
+
+
+async def _run_lanes():
+    order = {1: [], 2: []}
+    running = set()
+    overlap = []
+
+    async def handler(device_id, n):
+        if device_id in running:
+            overlap.append(device_id)
+        running.add(device_id)
+        await asyncio.sleep(0.001 * (5 - n % 5))
+        order[device_id].append(n)
+        running.discard(device_id)
+        if n == 4:
+            raise ValueError("bad result")
+
+    lanes = KeyedLanes(parallelism=4, max_pending=3)
+    for n in range(10):
+        await lanes.submit(1, handler(1, n))
+        await lanes.submit(2, handler(2, n))
+    await lanes.stop()
+
+    assert order[1] == list(range(10))
+    assert order[2] == list(range(10))
+    assert not overlap
+    assert lanes.stats() == {"lanes": 0, "pending": 0, "parallelism": 4, "processed": 18, "errors": 2}
+
+
+def test_keyed_lanes():
+    asyncio.run(_run_lanes())
+    print("✅ Keyed lanes OK")
+
+
+if __name__ == "__main__":
+    test_work_queue()
+    test_keyed_lanes()
@@ -2,9 +2,33 @@
 import aiohttp
 import json
 import asyncio
+import json_codec
+import copy
+import random
+import time
+from datetime import timezone
+from device_registry import DeviceRegistry, project_device
+from rate_limit import TokenBucket
+from attribute_coalescer import AttributeCoalescer
+from user_index import UserIndex
+from work_queue import WorkQueue
+from command_queue import DeviceCommandQueue
+
+
+class TraccarHTTPError(RuntimeError):
+    """Non-success HTTP status from Traccar; keeps the status for retry decisions."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
 
 class TraccarClient:
-    def __init__(self, base_url: str, token: str, verify_ssl: bool = True, session: aiohttp.ClientSession = None):
+    def __init__(self, base_url: str, token: str, verify_ssl: bool = True, session: aiohttp.ClientSession = None,
+                 coalesce_window: float = 0.0, optimistic_writes: bool = True,
+                 max_cache_age: float = 600.0, user_index_ttl: float = 3600.0,
+                 command_gap: float = 0.0, command_release_timeout: float = 60.0,
+                 command_concurrency: int = 10, command_rate: float = None):
         if base_url.endswith('/'):
             base_url = base_url.rstrip('/')
         self._base_url = base_url
@@ -13,6 +37,42 @@ class TraccarClient:
         self._session = session
         self._closed_session = False
         self._ws_message_count = 0
+        # Bounded frame queue + workers, created by `listen_socket`.
+        self.ws_queue = None
+        # Local copy of the device list; see `load_devices`.
+        self.registry = DeviceRegistry()
+        # email/name/login -> user id; see `find_user_id_by_username`.
+        self.users = UserIndex(ttl=user_index_ttl)
+        # With a window > 0, attribute updates for the same device that arrive
+        # close together are merged into a single write.
+        self._coalescer = AttributeCoalescer(self._write_device_attributes, coalesce_window) if coalesce_window > 0 else None
+        # Build attribute PUTs from the registry copy (no GET) while it is
+        # younger than `max_cache_age` seconds; see `modify_device_attributes`.
+        self.optimistic_writes = optimistic_writes
+        self.max_cache_age = max_cache_age
+        self._device_locks: dict = {}
+        # In-flight GETs shared by concurrent identical calls; see `_call`.
+        self._inflight_gets: dict = {}
+        self.singleflight_hits = 0
+        self.singleflight_misses = 0
+        # Device PUTs sent vs. skipped because nothing would have changed.
+        self.device_writes = 0
+        self.skipped_writes = 0
+        # Optional CommandTracker fed with every command sent; see `send_command`.
+        self.tracker = None
+        # With a gap > 0, commands to the same device are queued and paced;
+        # see `command_queue.DeviceCommandQueue`.
+        self.command_queue = DeviceCommandQueue(
+            self._send_command_now, min_gap=command_gap, release_timeout=command_release_timeout,
+            expects_answer=lambda data: self.tracker is not None and self.tracker.expects_answer(data),
+        ) if command_gap > 0 else None
+        # (POST slots, token bucket) shared by every `send_commands` call made
+        # without its own limits, so sweeps running side by side (and
+        # catch-ups) split one budget.
+        self.command_limits = (
+            asyncio.Semaphore(max(1, command_concurrency)),
+            TokenBucket(command_rate, burst=max(1, command_concurrency)) if command_rate else None,
+        )
 
     async def _get_session(self):
         if self._session is None:
@@ -28,6 +88,43 @@ class TraccarClient:
             self._session = None
 
     async def _call(self, path: str, params: dict = None):
+        """GET `path` and return the parsed JSON.
+
+        Identical GETs (same path and params) issued while one is already in
+        flight share that request instead of sending their own. Every caller,
+        the one that started it included, gets its own deep copy of the
+        parsed result, so nobody sees another caller's mutations.
+        """
+        if isinstance(params, dict):
+            key = (path, tuple(sorted(params.items())))
+        else:
+            key = (path, tuple(params or ()))
+        task = self._inflight_gets.get(key)
+        if task is not None:
+            self.singleflight_hits += 1
+            return copy.deepcopy(await asyncio.shield(task))
+
+        self.singleflight_misses += 1
+        task = asyncio.ensure_future(self._get_json(path, params))
+        self._inflight_gets[key] = task
+        task.add_done_callback(lambda t: self._gets_done(key, t))
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _gets_done(self, key, task):
+        self._inflight_gets.pop(key, None)
+        # Retrieve the exception so it isn't reported as never retrieved when
+        # every waiter was cancelled.
+        if not task.cancelled():
+            task.exception()
+
+    def singleflight_stats(self) -> dict:
+        return {
+            "hits": self.singleflight_hits,
+            "misses": self.singleflight_misses,
+            "in_flight": len(self._inflight_gets),
+        }
+
+    async def _get_json(self, path: str, params: dict = None):
         sess = await self._get_session()
         url = f"{self._base_url}/{path.lstrip('/')}"
         url = f"{self._base_url}/{path.lstrip('/')}"
@@ -36,10 +133,10 @@ class TraccarClient:
             headers["Authorization"] = f"Bearer {self._token}"
 
         async with sess.get(url, headers=headers, params=params, ssl=self._verify_ssl) as resp:
-            text = await resp.text()
+            body = await resp.read()
             if resp.status != 200:
-                raise RuntimeError(f"API returned {resp.status}: {text}")
-            return json.loads(text)
+                raise RuntimeError(f"API returned {resp.status}: {body.decode('utf-8', 'replace')}")
+            return json_codec.loads(body)
 
     async def _post(self, path: str, data: dict):
         sess = await self._get_session()
@@ -49,27 +146,116 @@ class TraccarClient:
         if self._token:
              headers["Authorization"] = f"Bearer {self._token}"
 
-        async with sess.post(url, headers=headers, json=data, ssl=self._verify_ssl) as resp:
-            text = await resp.text()
+        async with sess.post(url, headers=headers, data=json_codec.dumps(data), ssl=self._verify_ssl) as resp:
+            body = await resp.read()
             if resp.status not in (200, 201, 202):
-                raise RuntimeError(f"POST {resp.status}: {text}")
-            return json.loads(text)
-
-    async def get_device(self, dev_id: int):
-        return await self._call(f"devices/{dev_id}")
+                raise RuntimeError(f"POST {resp.status}: {body.decode('utf-8', 'replace')}")
+            return json_codec.loads(body)
+
+    async def get_device(self, dev_id: int, refresh: bool = False):
+        if not refresh:
+            dev = self.registry.get(dev_id)
+            if dev is not None:
+                return dev
+        dev = await self._call(f"devices/{dev_id}")
+        self.registry.put(dev)
+        return dev
+
+    async def get_devices(self, params: dict = None, refresh: bool = False):
+        # Served from the registry when it is loaded and the query is one it
+        # can answer (the full list or a uniqueId lookup). Per-user queries
+        # depend on permissions, so those always go to Traccar.
+        if self.registry.loaded and not refresh:
+            if not params:
+                return self.registry.all()
+            if set(params) == {"uniqueId"}:
+                dev = self.registry.get_by_unique_id(params["uniqueId"])
+                if dev is not None:
+                    return [dev]
+
+        if not params:
+            await self.load_devices()
+            devices = self.registry.all()
+        else:
+            devices = await self._call("devices?all=true", params=params)
+            for dev in devices:
+                self.registry.put(dev)
+        return devices
+
+    async def iter_devices(self, fields=None, attributes=None, params: dict = None):
+        """Stream `devices?all=true`, yielding one device at a time.
+
+        The body is parsed incrementally, so only one device is held in memory
+        at a time (plus the read buffer) instead of the whole response string
+        and list. `fields` / `attributes` optionally project each device down to
+        the keys the caller needs, e.g. `fields=("id", "status", "model")`.
+        """
+        sess = await self._get_session()
+        url = f"{self._base_url}/devices?all=true"
+        headers = {"Accept": "application/json"}
+        if self._token:
+            headers["Authorization"] = f"Bearer {self._token}"
 
-    async def get_devices(self, params: dict = None):
-        return await self._call("devices?all=true", params=params)
+        async with sess.get(url, headers=headers, params=params, ssl=self._verify_ssl) as resp:
+            if resp.status != 200:
+                body = await resp.read()
+                raise RuntimeError(f"API returned {resp.status}: {body.decode('utf-8', 'replace')}")
+            stream = json_codec.JsonArrayStream()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                for raw in stream.feed(chunk):
+                    yield project_device(json_codec.loads(raw), fields, attributes)
+            if not stream.closed:
+                raise RuntimeError("Device list truncated: response ended before the closing ]")
+
+    async def load_devices(self) -> int:
+        """Stream the full device list from Traccar into the registry; returns the count.
+
+        Each device is merged into the registry as it is parsed, so the fleet
+        is held once (in the registry), not also as a list. Devices Traccar
+        no longer returned are removed only after the whole list arrived; a
+        failed or truncated response raises and removes nothing.
+        """
+        seen = set()
+        async for dev in self.iter_devices():
+            self.registry.put(dev)
+            seen.add(dev.get("id"))
+        self.registry.retain(seen)
+        return len(seen)
+
+    async def find_devices(self, model: str = None, status: str = None):
+        """Devices filtered by model (top-level or attributes.model) and/or status."""
+        if not self.registry.loaded:
+            await self.load_devices()
+        return self.registry.filter(model=model, status=status)
+
+    async def get_events_report(self, device_ids, from_time, to_time, types=None):
+        """Events for `device_ids` between two aware datetimes, from `reports/events`."""
+        def iso(dt):
+            return dt.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+        params = [("deviceId", d) for d in device_ids]
+        params += [("from", iso(from_time)), ("to", iso(to_time))]
+        params += [("type", t) for t in types or ()]
+        return await self._call("reports/events", params=params)
 
     async def get_users(self, params: dict = None):
         return await self._call("users", params=params)
 
     async def find_user_id_by_username(self, username: str):
-        users = await self.get_users()
-        for u in users:
-            if u.get("email") == username or u.get("name") == username or u.get("login") == username:
-                return u.get("id")
-        return 0
+        if not username:
+            return 0
+        if not self.users.loaded:
+            self.users.load(await self.get_users())
+
+        user_id = self.users.lookup(username)
+        if user_id:
+            return user_id
+
+        # Miss: the user may have been created since the index was built.
+        # Ask Traccar to search server-side instead of re-downloading everyone.
+        for u in await self.get_users({"search": username}):
+            self.users.add(u)
+        return self.users.lookup(username) or 0
 
     async def add_permission(self, user_id: int, device_id: int):
         payload = {"userId": user_id, "deviceId": device_id}
@@ -114,25 +300,229 @@ class TraccarClient:
     # -----------------------------------------------------------
     # Send custom command
     # -----------------------------------------------------------
-    async def send_command(self, device_id: int, data: str, no_queue: bool = True):
+    async def send_command(self, device_id: int, data: str, no_queue: bool = True, track: bool = True,
+                           paced: bool = True, retry: bool = False, limits=None):
+        """Send a custom command; goes through `command_queue` (if set) unless `paced` is False.
+
+        `retry` marks a resend of an unanswered command: it goes to the front
+        of the device's queue instead of being collapsed into the original.
+        `limits` is a `(semaphore, token bucket or None)` pair held around the
+        POST itself only, not while the command waits in the device's queue.
+        """
+        if self.command_queue and paced:
+            return await self.command_queue.submit(device_id, data, retry=retry, no_queue=no_queue,
+                                                   track=track, limits=limits)
+        return await self._send_command_now(device_id, data, no_queue=no_queue, track=track, limits=limits)
+
+    async def _send_command_now(self, device_id: int, data: str, no_queue: bool = True, track: bool = True,
+                                limits=None):
         payload = {
             "deviceId": device_id,
             "type": "custom",
             "attributes": {"data": data, "noQueue": no_queue}
         }
-        return await self._post("commands/send", payload)
+        if limits:
+            sem, bucket = limits
+            async with sem:
+                if bucket:
+                    await bucket.acquire()
+                result = await self._post("commands/send", payload)
+        else:
+            result = await self._post("commands/send", payload)
+        if self.tracker and track:
+            self.tracker.sent(device_id, data, model=self.registry.model(device_id))
+        return result
 
     # -----------------------------------------------------------
-    # Update only attributes (safe: retrieves full object first)
+    # Send many custom commands with bounded concurrency
     # -----------------------------------------------------------
-    async def update_device_attributes(self, device_id: int, new_attrs: dict):
-        dev = await self.get_device(device_id)
+    async def send_commands(self, commands, concurrency: int = None, rate: float = None,
+                            no_queue: bool = True, window: float = 0.0, on_progress=None, skip=None):
+        """Send `(device_id, data)` pairs concurrently.
+
+        At most `concurrency` POSTs are in flight at once and, if `rate` is
+        given, no more than `rate` commands are started per second. Without
+        either, the client-wide `command_concurrency` / `command_rate` limits
+        (`command_limits`) apply, shared with every other such call. The
+        limits cover only the POST: a command waiting in its device's queue
+        (for the previous reply) holds no slot, so a silent device can't
+        stall sends to other devices. With a `window` (seconds) the starts
+        are spread evenly over it instead of going out in one burst: each
+        command gets its own slot of `window / len(commands)` and starts at a
+        random point inside it. `skip(device_id, data)` is asked right before
+        each send; a command it rejects is not sent and reported with
+        `skipped` set. `on_progress(done, total, result)` is called after
+        every command. Returns one result dict per pair, in input order:
+        `{"device_id", "command", "ok", "skipped", "result", "error", "elapsed"}`.
+        """
+        commands = list(commands)
+        total = len(commands)
+        if concurrency is None and rate is None:
+            limits = self.command_limits
+        else:
+            limits = (asyncio.Semaphore(max(1, concurrency or 10)),
+                      TokenBucket(rate, burst=max(1, concurrency or 10)) if rate else None)
+        done = 0
+
+        async def send_one(device_id, data):
+            nonlocal done
+            started = time.monotonic()
+            out = {"device_id": device_id, "command": data, "ok": False, "skipped": False,
+                   "result": None, "error": None}
+            if skip and skip(device_id, data):
+                out["skipped"] = True
+            else:
+                try:
+                    out["result"] = await self.send_command(device_id, data, no_queue=no_queue, limits=limits)
+                    out["ok"] = True
+                except Exception as e:
+                    out["error"] = str(e)
+            out["elapsed"] = time.monotonic() - started
+            done += 1
+            if on_progress:
+                on_progress(done, total, out)
+            return out
+
+        slot = window / total if window > 0 and total > 1 else 0.0
+        start = time.monotonic()
+        tasks = []
+        try:
+            for i, (device_id, data) in enumerate(commands):
+                if slot:
+                    delay = start + (i + random.random()) * slot - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(send_one(device_id, data)))
+            return await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
 
-        attrs = dev.get("attributes", {})
-        attrs.update(new_attrs)
+    # -----------------------------------------------------------
+    # Update only attributes (read-modify-write of the full object)
+    # -----------------------------------------------------------
+    def write_stats(self) -> dict:
+        return {"writes": self.device_writes, "skipped": self.skipped_writes}
+
+    def _attributes_unchanged(self, device_id: int, new_attrs: dict) -> bool:
+        """True if the registry copy is fresh and already holds every value in `new_attrs`."""
+        age = self.registry.age(device_id)
+        if age is None or age > self.max_cache_age:
+            return False
+        attrs = (self.registry.get(device_id) or {}).get("attributes") or {}
+        return all(k in attrs and attrs[k] == v for k, v in new_attrs.items())
+
+    async def update_device_attributes(self, device_id: int, new_attrs: dict, force: bool = False):
+        """Merge `new_attrs` into a device's attributes.
+
+        Nothing is sent when every value already matches the stored
+        attributes; pass `force=True` to PUT regardless. The check is skipped
+        while the coalescer holds an unwritten update for the device, since
+        the stored values are about to change.
+        """
+        if force:
+            return await self._write_device_attributes(device_id, new_attrs, force=True)
+        busy = self._coalescer is not None and self._coalescer.busy(device_id)
+        if not busy and self._attributes_unchanged(device_id, new_attrs):
+            self.skipped_writes += 1
+            return True
+        if self._coalescer:
+            return await self._coalescer.update(device_id, new_attrs)
+        return await self._write_device_attributes(device_id, new_attrs)
+
+    async def _write_device_attributes(self, device_id: int, new_attrs: dict, force: bool = False):
+        changed = []
+
+        def merge(attrs):
+            changed[:] = [k for k, v in new_attrs.items() if k not in attrs or attrs[k] != v]
+            attrs.update(new_attrs)
+            return attrs
+
+        await self.modify_device_attributes(device_id, merge, force=force)
+        if changed or force:
+            print(f"✅ Saved device {device_id} attributes:", new_attrs)
+        return True
 
-        payload = {
-            "id": device_id,
+    def _device_lock(self, device_id: int) -> asyncio.Lock:
+        lock = self._device_locks.get(device_id)
+        if lock is None:
+            lock = self._device_locks[device_id] = asyncio.Lock()
+        return lock
+
+    async def _device_for_write(self, device_id: int):
+        """Return `(device, fresh)`: the cached copy if it is recent enough, else a GET."""
+        if self.optimistic_writes:
+            age = self.registry.age(device_id)
+            if age is not None and age <= self.max_cache_age:
+                return self.registry.get(device_id), False
+        return await self.get_device(device_id, refresh=True), True
+
+    async def modify_device_attributes(self, device_id: int, fn, force: bool = False):
+        """Atomically apply `fn` to a device's attributes and PUT the result.
+
+        `fn` gets a copy of the current attributes and returns the complete new
+        attributes dict, or None to leave the device untouched. Calls for the
+        same device are serialized, so concurrent read-modify-write handlers
+        can't overwrite each other.
+
+        With `optimistic_writes` the PUT is built from the registry copy (no
+        GET). If Traccar rejects it, or the registry copy changed while the PUT
+        was in flight with edits to keys `fn` didn't write, the change is
+        rebased on the newer device and written again. Returns the device as
+        saved.
+
+        If `fn` leaves the attributes as they were, no PUT is sent (counted in
+        `skipped_writes`) unless `force` is set.
+        """
+        async with self._device_lock(device_id):
+            dev, fresh = await self._device_for_write(device_id)
+
+            for attempt in range(3):
+                base_attrs = dict(dev.get("attributes") or {})
+                new_attrs = fn(dict(base_attrs))
+                if new_attrs is None or (new_attrs == base_attrs and not force):
+                    self.skipped_writes += 1
+                    return dev
+
+                payload = self._device_payload(dev, new_attrs)
+                base_version = self.registry.version(device_id)
+                try:
+                    saved = await self._put_device(device_id, payload)
+                except TraccarHTTPError as e:
+                    # A cached copy can be rejected (e.g. renamed/removed device);
+                    # retry once from a fresh GET before giving up.
+                    if fresh or e.status >= 500:
+                        raise
+                    self.registry.mark_stale(device_id)
+                    dev, fresh = await self.get_device(device_id, refresh=True), True
+                    continue
+
+                # Conflict check: something else (a WS devices frame) updated the
+                # registry while our PUT was in flight. If it touched keys we
+                # didn't write, our PUT has just overwritten them server-side.
+                if self.registry.version(device_id) != base_version:
+                    current = self.registry.get(device_id) or dev
+                    current_attrs = current.get("attributes") or {}
+                    written = {k for k in set(new_attrs) | set(base_attrs)
+                               if new_attrs.get(k) != base_attrs.get(k)}
+                    foreign = {k for k in set(current_attrs) | set(base_attrs)
+                               if k not in written and current_attrs.get(k) != base_attrs.get(k)}
+                    if foreign and attempt < 2:
+                        print(f"⚠️ Device {device_id} changed during write ({sorted(foreign)}), rebasing")
+                        dev = current
+                        continue
+
+                self.registry.put(saved if isinstance(saved, dict) and saved.get("id") else payload)
+                return self.registry.get(device_id)
+
+            return dev
+
+    @staticmethod
+    def _device_payload(dev: dict, attrs: dict) -> dict:
+        return {
+            "id": dev["id"],
             "name": dev["name"],
             "uniqueId": dev["uniqueId"],
             "status": dev.get("status"),
@@ -143,36 +533,56 @@ class TraccarClient:
             "attributes": attrs
         }
 
-        sess = await self._get_session()
-        url = f"{self._base_url}/devices/{device_id}"
-        headers = {"Authorization": f"Bearer {self._token}", "Content-Type": "application/json"}
-
-        async with sess.put(url, headers=headers, json=payload, ssl=self._verify_ssl) as resp:
-            if resp.status not in (200, 204):
-                text = await resp.text()
-                raise RuntimeError(f"PUT {resp.status}: {text}")
-
-        print(f"✅ Saved device {device_id} attributes:", new_attrs)
-        return True
-
-    async def update_device(self, device_id: int, device_data: dict):
+    async def _put_device(self, device_id: int, payload: dict):
+        """PUT a full device object; returns the device Traccar sent back (or None)."""
         sess = await self._get_session()
         url = f"{self._base_url}/devices/{device_id}"
         headers = {"Content-Type": "application/json"}
         if self._token:
             headers["Authorization"] = f"Bearer {self._token}"
 
-        async with sess.put(url, headers=headers, json=device_data, ssl=self._verify_ssl) as resp:
+        async with sess.put(url, headers=headers, data=json_codec.dumps(payload), ssl=self._verify_ssl) as resp:
+            body = await resp.read()
             if resp.status not in (200, 204):
-                text = await resp.text()
-                raise RuntimeError(f"PUT {resp.status}: {text}")
-        
+                raise TraccarHTTPError(resp.status, f"PUT {resp.status}: {body.decode('utf-8', 'replace')}")
+            self.device_writes += 1
+            try:
+                return json_codec.loads(body) if body else None
+            except json_codec.DecodeError:
+                return None
+
+    async def update_device(self, device_id: int, device_data: dict, force: bool = False):
+        """PUT a full device object, unless the fresh registry copy already matches it."""
+        async with self._device_lock(device_id):
+            age = self.registry.age(device_id)
+            if not force and age is not None and age <= self.max_cache_age:
+                cached = self.registry.get(device_id) or {}
+                if all(cached.get(k) == v for k, v in device_data.items()):
+                    self.skipped_writes += 1
+                    return True
+            saved = await self._put_device(device_id, device_data)
+            self.registry.put(saved if isinstance(saved, dict) and saved.get("id") else device_data)
         return True
 
     # -----------------------------------------------------------
     # WebSocket listener with auto-reconnect
     # -----------------------------------------------------------
-    async def listen_socket(self, on_message=None):
+    async def listen_socket(self, on_message=None, workers: int = 4, queue_size: int = 1000,
+                            frame_filter=None, on_connect=None):
+        """Read the Traccar socket forever, reconnecting with backoff.
+
+        Text frames are put on a bounded `WorkQueue` and handled by `workers`
+        worker tasks calling `on_message`. When the queue is full the reader
+        waits, which pushes back on the socket instead of spawning a task per
+        frame. Call `stop_socket_queue()` on shutdown to drain pending frames.
+        If `frame_filter(data)` is given and returns False, the frame is dropped
+        before it is queued or parsed. `on_connect()` runs after every
+        successful (re)connect, e.g. to backfill events missed in the gap.
+        """
+        if on_message and self.ws_queue is None:
+            self.ws_queue = WorkQueue(on_message, workers=workers, maxsize=queue_size, name="WS")
+            self.ws_queue.start()
+
         backoff = 1   # start with 1 second delay
 
         while True:
@@ -205,16 +615,22 @@ class TraccarClient:
                     print("✅ WebSocket connected.")
                     backoff = 1  # reset on success
 
+                    if on_connect:
+                        try:
+                            result = on_connect()
+                            if asyncio.iscoroutine(result):
+                                await result
+                        except Exception as e:
+                            print(f"❌ WS on_connect failed: {e}")
+
                     async for msg in ws:
                         self._ws_message_count += 1
                         data_size = len(msg.data) if isinstance(msg.data, str) else "-"
                         #print(f"📩 WS message #{self._ws_message_count}: type={msg.type} size={data_size}")
 
                         if msg.type == aiohttp.WSMsgType.TEXT:
-                            if on_message:
-                                result = on_message(msg.data)
-                                if asyncio.iscoroutine(result):
-                                    asyncio.create_task(result)
+                            if self.ws_queue and (frame_filter is None or frame_filter(msg.data)):
+                                await self.ws_queue.put(msg.data)
                         elif msg.type == aiohttp.WSMsgType.PING:
                             print("🏓 WS ping received")
                         elif msg.type == aiohttp.WSMsgType.PONG:
@@ -235,12 +651,19 @@ class TraccarClient:
                 print(f"❌ WS connection failed: {e}")
 
             # reconnect logic
+            if self.ws_queue:
+                print(f"📊 WS queue: {self.ws_queue.stats()}")
             print(f"♻️ Reconnecting WebSocket in {backoff} seconds...")
             await asyncio.sleep(backoff)
 
             # increase delay up to max 30 seconds
             backoff = min(backoff * 2, 30)
 
+    async def stop_socket_queue(self, timeout: float = 10.0):
+        """Let the WS workers finish queued frames, then stop them."""
+        if self.ws_queue:
+            await self.ws_queue.stop(timeout)
+
     # -----------------------------------------------------------
     # User / Auth Methods
     # -----------------------------------------------------------
@@ -267,11 +690,11 @@ class TraccarClient:
         if self._token:
             headers["Authorization"] = f"Bearer {self._token}"
             
-        async with sess.put(url, headers=headers, json=user_data, ssl=self._verify_ssl) as resp:
-            text = await resp.text()
+        async with sess.put(url, headers=headers, data=json_codec.dumps(user_data), ssl=self._verify_ssl) as resp:
+            body = await resp.read()
             if resp.status not in (200, 201, 202):
-                raise RuntimeError(f"Update User failed {resp.status}: {text}")
-            return json.loads(text)
+                raise RuntimeError(f"Update User failed {resp.status}: {body.decode('utf-8', 'replace')}")
+            return json_codec.loads(body)
 
     async def get_notifications(self):
         return await self._call("notifications")
@@ -0,0 +1,57 @@
+# user_index.py
+import time
+from typing import Optional
+
+
+class UserIndex:
+    """Lookup table from email / name / login to Traccar user id.
+
+    Built from one full `/users` download and then kept current incrementally:
+    users found by a server-side search on a miss, and users we create
+    ourselves, are added with `add()`. The whole index is rebuilt once it is
+    older than `ttl` seconds (or after `invalidate()`), which also picks up
+    renames and deletions made elsewhere.
+    """
+
+    KEYS = ("email", "name", "login")
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._by_key: dict = {}
+        self._keys_by_id: dict = {}
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self._keys_by_id)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, users):
+        self._by_key = {}
+        self._keys_by_id = {}
+        for user in users:
+            self.add(user)
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def add(self, user: dict):
+        user_id = user.get("id")
+        if not user_id:
+            return
+        self.remove(user_id)
+        keys = {user.get(k) for k in self.KEYS if user.get(k)}
+        for key in keys:
+            self._by_key[key] = user_id
+        self._keys_by_id[user_id] = keys
+
+    def remove(self, user_id: int):
+        for key in self._keys_by_id.pop(user_id, ()):
+            if self._by_key.get(key) == user_id:
+                del self._by_key[key]
+
+    def lookup(self, username: str) -> Optional[int]:
+        return self._by_key.get(username)
@@ -0,0 +1,57 @@
+# vehicle_names.py
+import asyncio
+from typing import Optional
+
+# Registered devices are named "خودرو N" (vehicle N), numbered per user
+VEHICLE_PREFIX = "خودرو"
+
+
+def vehicle_number(name: str) -> Optional[int]:
+    """The N of a "خودرو N" name, or None for any other name."""
+    parts = (name or "").split(" ")
+    if len(parts) > 1 and parts[0] == VEHICLE_PREFIX:
+        try:
+            return int(parts[1])
+        except ValueError:
+            return None
+    return None
+
+
+class VehicleNumberIndex:
+    """Highest "خودرو N" number in use per user.
+
+    A user's entry is built from one device listing the first time a name is
+    needed, then kept current with `observe()` as names are assigned or seen
+    in device frames, so naming the next vehicle is a dict lookup. `lock()`
+    gives a per-user lock to hold from picking a name until it is saved, so
+    concurrent registrations for one user get distinct numbers.
+    """
+
+    def __init__(self):
+        self._highest: dict = {}   # user_id -> highest N in use (0 if none)
+        self._locks: dict = {}
+
+    def __len__(self):
+        return len(self._highest)
+
+    def loaded(self, user_id: int) -> bool:
+        return user_id in self._highest
+
+    def load(self, user_id: int, devices):
+        numbers = [vehicle_number(d.get("name", "")) for d in devices]
+        self._highest[user_id] = max((n for n in numbers if n is not None), default=0)
+
+    def observe(self, user_id: int, name: str):
+        """Record a device name of `user_id`; ignored until the user is loaded."""
+        n = vehicle_number(name)
+        if n is not None and user_id in self._highest and n > self._highest[user_id]:
+            self._highest[user_id] = n
+
+    def next_name(self, user_id: int) -> str:
+        return f"{VEHICLE_PREFIX} {self._highest.get(user_id, 0) + 1}"
+
+    def lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
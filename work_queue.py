@@ -0,0 +1,163 @@
+# work_queue.py
+import asyncio
+import time
+from collections import deque
+
+
+class WorkQueue:
+    """Bounded queue drained by a fixed pool of worker tasks.
+
+    `put()` waits while the queue is full, so a fast producer (the WebSocket
+    reader) is slowed down to the pace of the workers instead of piling up
+    unbounded tasks. Every time a producer has to wait is counted as an
+    overflow. `stop()` lets the workers finish what is already queued.
+    """
+
+    def __init__(self, handler, workers: int = 4, maxsize: int = 1000, name: str = "queue"):
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._workers_count = max(1, workers)
+        self._workers: list = []
+        self.name = name
+        self.maxsize = maxsize
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self.overflows = 0
+        self.overflow_wait = 0.0
+        self.max_depth = 0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self._workers_count)
+            ]
+
+    async def put(self, item):
+        if self._queue.full():
+            self.overflows += 1
+            started = time.monotonic()
+            await self._queue.put(item)
+            self.overflow_wait += time.monotonic() - started
+        else:
+            self._queue.put_nowait(item)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                result = self._handler(item)
+                if asyncio.iscoroutine(result):
+                    await result
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ {self.name} worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain queued work (up to `timeout` seconds), then stop the workers."""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ {self.name}: {self._queue.qsize()} items left undrained after {timeout}s")
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "workers": self._workers_count,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "errors": self.errors,
+            "overflows": self.overflows,
+            "overflow_wait": round(self.overflow_wait, 3),
+        }
+
+
+class KeyedLanes:
+    """Run submitted coroutines in order per key, different keys in parallel.
+
+    Each key (e.g. a deviceId) gets its own FIFO lane drained by one task, so
+    work for one device never interleaves, while up to `parallelism` lanes run
+    at once. `submit()` waits once `max_pending` coroutines are queued across
+    all lanes, pushing back on whoever feeds the lanes.
+    """
+
+    def __init__(self, parallelism: int = 16, max_pending: int = 5000, name: str = "lanes"):
+        self._lanes: dict = {}
+        self._tasks: dict = {}
+        self._running = asyncio.Semaphore(max(1, parallelism))
+        self._capacity = asyncio.Semaphore(max(1, max_pending))
+        self.name = name
+        self.parallelism = parallelism
+        self.max_pending = max_pending
+        self.pending = 0
+        self.processed = 0
+        self.errors = 0
+
+    async def submit(self, key, coro):
+        await self._capacity.acquire()
+        self.pending += 1
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            self._tasks[key] = asyncio.create_task(self._drain(key, lane))
+        lane.append(coro)
+
+    async def _drain(self, key, lane):
+        try:
+            while lane:
+                coro = lane.popleft()
+                try:
+                    async with self._running:
+                        await coro
+                    self.processed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ {self.name} handler error (key {key}): {e}")
+                finally:
+                    self.pending -= 1
+                    self._capacity.release()
+        finally:
+            # Runs without yielding once the lane is empty, so no submit() can
+            # slip in between the emptiness check and the removal.
+            self._lanes.pop(key, None)
+            self._tasks.pop(key, None)
+            for coro in lane:
+                coro.close()
+                self.pending -= 1
+                self._capacity.release()
+
+    async def stop(self, timeout: float = 10.0):
+        """Wait for queued work (up to `timeout` seconds), then cancel what is left."""
+        tasks = list(self._tasks.values())
+        if tasks:
+            done, still_running = await asyncio.wait(tasks, timeout=timeout)
+            if still_running:
+                print(f"⚠️ {self.name}: {self.pending} items left undrained after {timeout}s")
+            for task in still_running:
+                task.cancel()
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "lanes": len(self._lanes),
+            "pending": self.pending,
+            "parallelism": self.parallelism,
+            "processed": self.processed,
+            "errors": self.errors,
+        }